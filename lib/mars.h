@@ -4,7 +4,9 @@
 #define long int32_t
 #define uint uint32_t
 #define byte char
-#define HEAP_START (int*)0x10010000
+// the start of the MARS heap; the static data segment before it (from 0x10010000)
+// holds the program's globals and switch jump tables
+#define HEAP_START (int*)0x10040000
 
 int* __heap_ptr = HEAP_START;
 
@@ -1,13 +1,61 @@
+import argparse
 import sys
-from mips_clang.llvm_parse import parse
 from mips_clang.clang import Clang
-from mips_clang.llvm_translate import ll_as_mips
-from mips_clang.pretty import prettyprint
+from mips_clang.llvm_inline import INLINE_MAX_DEPTH, INLINE_MAX_SIZE
+from mips_clang.llvm_translate import _LLVMTranslator
 
 
-with open(sys.argv[1]) as fl:
-    clang = Clang()
-    ll_source = clang.compile_to_ll(fl.read())
-    
-    print(ll_as_mips(ll_source))
-    
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description="Compile C/C++ code to MIPS assembly for MARS")
+    arg_parser.add_argument("input_file")
+    arg_parser.add_argument(
+        "--no-loop-opt",
+        action="store_true",
+        help="disable loop-invariant code motion and induction variable strength reduction"
+    )
+    arg_parser.add_argument(
+        "--inline-max-size",
+        type=int,
+        default=INLINE_MAX_SIZE,
+        help="inline functions with at most this many LLVM instructions (0 disables inlining)"
+    )
+    arg_parser.add_argument(
+        "--inline-max-depth",
+        type=int,
+        default=INLINE_MAX_DEPTH,
+        help="maximum number of nested calls to inline into a single call site"
+    )
+    arg_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="translate the functions of large modules in this many processes"
+    )
+    arg_parser.add_argument(
+        "--inline-log",
+        action="store_true",
+        help="print every inlining decision to stderr"
+    )
+    args = arg_parser.parse_args()
+
+    with open(args.input_file) as fl:
+        clang = Clang()
+        ll_source = clang.compile_to_ll(fl.read())
+
+        translator = _LLVMTranslator(
+            ll_source,
+            loop_optimizations=not args.no_loop_opt,
+            inline_max_size=args.inline_max_size,
+            inline_max_depth=args.inline_max_depth,
+            jobs=args.jobs
+        )
+        print(translator.translate())
+
+        if args.inline_log:
+            for decision in translator.inline_decisions:
+                print(decision, file=sys.stderr)
+
+
+# the translator may start worker processes (see --jobs), which import this file
+if __name__ == "__main__":
+    main()
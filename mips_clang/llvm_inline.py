@@ -0,0 +1,373 @@
+"""
+Inlining of small, non-recursive functions at their call sites.
+
+Every call translated to MIPS pays for a stack frame, saving the return address and
+passing arguments through memory. Inlining replaces the `call` with a copy of the callee's
+statements, with its parameters replaced by the call's arguments so that constant
+arguments appear directly in the inlined body.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Callable, Optional
+from .llvm_loops import find_dominators, find_local_slots, split_blocks
+from .llvm_parse import LLVMFunction, LLVMInstruction, LLVMStatement, LLVMSymbol
+from .util import unwrap
+
+INLINE_MAX_SIZE = 24
+"""Functions with at most this many instructions are inlined"""
+
+INLINE_MAX_DEPTH = 3
+"""Maximum number of nested calls inlined into one call site (calls within inlined bodies)"""
+
+@dataclass
+class InlineDecision:
+    caller: str
+    callee: str
+    inlined: bool
+    reason: str
+    depth: int
+
+    def __str__(self) -> str:
+        return "{} {} into {} (depth {}): {}".format(
+            "inlined" if self.inlined else "did not inline",
+            self.callee, self.caller, self.depth, self.reason
+        )
+
+def _get_size(statements: list[LLVMStatement]) -> int:
+    return sum(1 for statement in statements if not statement.is_label())
+
+def _copy_statement(statement: LLVMStatement, rename: Callable[[LLVMSymbol], LLVMSymbol]) -> LLVMStatement:
+    """Return a copy of [statement] with every register it uses or assigns passed through [rename]"""
+
+    if statement.is_label():
+        return LLVMStatement.from_label(statement.get_label_name())
+
+    instruction = statement.get_instruction()
+    copy = LLVMInstruction(
+        name=instruction.name,
+        mode=instruction.mode,
+        associated_type=instruction.associated_type,
+        args=[rename(arg) for arg in instruction.args]
+    )
+
+    if statement.is_assignment():
+        return LLVMStatement.from_assignment(to=rename(statement.get_assignment_target()), instruction=copy)
+    return LLVMStatement.from_instruction(copy)
+
+def _is_call(statement: LLVMStatement) -> bool:
+    return not statement.is_label() and statement.get_instruction().name == "call"
+
+def _get_callee(statement: LLVMStatement) -> str:
+    return "@" + statement.get_instruction().args[0].get_global_name()
+
+def _find_recursive_functions(functions: list[LLVMFunction]) -> set[str]:
+    """
+    Return the names of the functions that can call themselves, directly or through other
+    functions (i.e. that are part of a cycle in the call graph)
+    """
+
+    calls = {
+        function.name: {_get_callee(s) for s in function.statements if _is_call(s)}
+        for function in functions
+    }
+    recursive: set[str] = set()
+
+    # Tarjan's strongly connected components algorithm, with an explicit stack so that
+    # long call chains do not hit Python's recursion limit
+    index: dict[str, int] = {}
+    lowlink: dict[str, int] = {}
+    component_stack: list[str] = []
+    on_stack: set[str] = set()
+
+    for root in calls:
+        if root in index:
+            continue
+        work = [(root, iter(calls[root]))]
+        index[root] = lowlink[root] = len(index)
+        component_stack.append(root)
+        on_stack.add(root)
+
+        while work:
+            name, callees = work[-1]
+            callee = next(callees, None)
+
+            if callee is not None:
+                if callee not in calls:
+                    continue
+                if callee not in index:
+                    index[callee] = lowlink[callee] = len(index)
+                    component_stack.append(callee)
+                    on_stack.add(callee)
+                    work.append((callee, iter(calls[callee])))
+                elif callee in on_stack:
+                    lowlink[name] = min(lowlink[name], index[callee])
+                continue
+
+            work.pop()
+            if work:
+                lowlink[work[-1][0]] = min(lowlink[work[-1][0]], lowlink[name])
+            if lowlink[name] != index[name]:
+                continue
+
+            component: list[str] = []
+            while not component or component[-1] != name:
+                component.append(component_stack.pop())
+                on_stack.remove(component[-1])
+
+            if len(component) > 1 or name in calls[name]:
+                recursive.update(component)
+
+    return recursive
+
+class _Inliner:
+    functions: dict[str, LLVMFunction]
+    bodies: dict[str, list[LLVMStatement]]
+    """The statements of each function before anything was inlined into it"""
+
+    recursive: set[str]
+    max_size: int
+    max_depth: int
+    decisions: list[InlineDecision]
+
+    def __init__(self, functions: list[LLVMFunction], max_size: int, max_depth: int) -> None:
+        self.functions = {function.name: function for function in functions}
+        # copied, since inlining modifies the instructions of the functions it inlines into
+        self.bodies = {
+            function.name: [_copy_statement(statement, lambda symbol: symbol) for statement in function.statements]
+            for function in functions
+        }
+        self.recursive = _find_recursive_functions(functions)
+        self.max_size = max_size
+        self.max_depth = max_depth
+        self.decisions = []
+
+    def get_refusal(self, callee: str, depth: int) -> Optional[str]:
+        """Return the reason not to inline a call to [callee], if any"""
+
+        if callee not in self.functions:
+            return "not defined in this module"
+        if callee in self.recursive:
+            return "recursive"
+
+        size = _get_size(self.bodies[callee])
+        if size > self.max_size:
+            return "{} instructions (limit {})".format(size, self.max_size)
+        if not any(not s.is_label() and s.get_instruction().name == "ret" for s in self.bodies[callee]):
+            return "never returns"
+        if depth > self.max_depth:
+            return "nested {} calls deep (limit {})".format(depth, self.max_depth)
+
+        return None
+
+    def inline_calls(self, function: LLVMFunction) -> None:
+        statements = function.statements
+        # how many calls deep each inlined call site is
+        depths: dict[int, int] = {}
+        inline_count = 0
+        i = 0
+
+        while i < len(statements):
+            statement = statements[i]
+            if not _is_call(statement):
+                i += 1
+                continue
+
+            callee = _get_callee(statement)
+            depth = depths.get(id(statement), 1)
+            refusal = self.get_refusal(callee, depth)
+
+            if refusal:
+                self.decisions.append(InlineDecision(function.name, callee, False, refusal, depth))
+                i += 1
+                continue
+
+            body, result = self.copy_body(callee, statement, "__inline{}_".format(inline_count))
+            inline_count += 1
+            if result:
+                # the callee's only returned value is used directly in place of the call's
+                # result
+                _replace_register(statements, statement.get_assignment_target(), result)
+            self.decisions.append(InlineDecision(
+                function.name, callee, True,
+                "{} instructions".format(_get_size(self.bodies[callee])), depth
+            ))
+
+            for inlined in body:
+                if _is_call(inlined):
+                    depths[id(inlined)] = depth + 1
+
+            # calls in the inlined body are considered next
+            statements[i:i + 1] = body
+
+        if inline_count:
+            _forward_constant_stores(function)
+
+    def copy_body(self, callee: str, call: LLVMStatement, prefix: str) -> tuple[list[LLVMStatement], Optional[LLVMSymbol]]:
+        """
+        Return a copy of the body of [callee] to replace [call] with. Registers and labels
+        of the callee are renamed with [prefix], and its parameters are replaced by the
+        call's arguments.
+
+        If the callee has a single `ret`, also return the value it returns, which should
+        replace the result of the call.
+        """
+
+        function = self.functions[callee]
+        body = self.bodies[callee]
+        call_instruction = call.get_instruction()
+        return_label = prefix + "return"
+        returns = [s for s in body if not s.is_label() and s.get_instruction().name == "ret"]
+        result: Optional[LLVMSymbol] = call.get_assignment_target() if call.is_assignment() else None
+
+        arguments = {
+            parameter.get_register_name(): argument
+            for parameter, argument in zip(function.parameters, call_instruction.args[1:])
+        }
+
+        def rename(symbol: LLVMSymbol) -> LLVMSymbol:
+            if not symbol.is_register():
+                return symbol
+            if symbol.get_register_name() in arguments:
+                return arguments[symbol.get_register_name()]
+
+            return LLVMSymbol(symbol.get_type(), "%" + prefix + symbol.get_register_name())
+
+        output: list[LLVMStatement] = []
+        returned: Optional[LLVMSymbol] = None
+        # with more than one "ret", the return value is passed through memory
+        return_slot: Optional[LLVMSymbol] = None
+
+        if result and len(returns) > 1:
+            return_slot = LLVMSymbol.from_argument("{}* %{}retval".format(
+                unwrap(call_instruction.associated_type).as_type_string(), prefix
+            ))
+            output.append(LLVMStatement.from_assignment(
+                to=return_slot,
+                instruction=LLVMInstruction(name="alloca", associated_type=call_instruction.associated_type)
+            ))
+
+        # a single "ret" at the end of the body can simply be removed, since execution
+        # continues with the statements following the call
+        falls_through = len(returns) == 1 and body[-1] is returns[0]
+
+        for statement in body:
+            if statement.is_label():
+                output.append(LLVMStatement.from_label(prefix + statement.get_label_name()))
+                continue
+
+            instruction = statement.get_instruction()
+            if instruction.name != "ret":
+                output.append(_copy_statement(statement, rename))
+                continue
+
+            # "ret" becomes a branch to the statements following the call
+            if result and return_slot:
+                output.append(LLVMStatement.from_instruction(LLVMInstruction(
+                    name="store",
+                    args=[rename(instruction.args[0]), return_slot]
+                )))
+            elif result:
+                returned = rename(instruction.args[0])
+            if not falls_through:
+                output.append(LLVMStatement.from_instruction(LLVMInstruction(
+                    name="br",
+                    args=[LLVMSymbol.from_argument("label %" + return_label)]
+                )))
+
+        if not falls_through:
+            output.append(LLVMStatement.from_label(return_label))
+
+        if result and return_slot:
+            output.append(LLVMStatement.from_assignment(
+                to=result,
+                instruction=LLVMInstruction(name="load", associated_type=call_instruction.associated_type, args=[return_slot])
+            ))
+
+        return output, returned
+
+def _replace_register(statements: list[LLVMStatement], register: LLVMSymbol, replacement: LLVMSymbol) -> None:
+    """Replace every use of [register] in [statements] with [replacement]"""
+
+    name = register.get_register_name()
+
+    for statement in statements:
+        if statement.is_label():
+            continue
+        instruction = statement.get_instruction()
+
+        if any(arg.is_register() and arg.get_register_name() == name for arg in instruction.args):
+            instruction.args = [
+                replacement if arg.is_register() and arg.get_register_name() == name else arg
+                for arg in instruction.args
+            ]
+
+def _forward_constant_stores(function: LLVMFunction) -> None:
+    """
+    Replace loads from local variables that are only ever assigned a single constant with
+    that constant. This propagates constant arguments into inlined bodies, where clang
+    stores each parameter into its own variable before using it.
+    """
+
+    blocks = split_blocks(function.statements)
+    dominators = find_dominators(blocks)
+    local_slots = find_local_slots(function.statements)
+    # the block and position of every statement
+    positions: dict[int, tuple[str, int]] = {
+        id(statement): (block.label, i) for block in blocks for i, statement in enumerate(block.statements)
+    }
+    allocas: dict[str, LLVMStatement] = {}
+    stores: dict[str, list[LLVMStatement]] = {}
+    loads: dict[str, list[LLVMStatement]] = {}
+
+    for statement in function.statements:
+        if statement.is_label():
+            continue
+        instruction = statement.get_instruction()
+
+        if instruction.name == "alloca":
+            allocas[statement.get_assignment_target().get_register_name()] = statement
+        elif instruction.name == "store" and instruction.args[1].is_register():
+            stores.setdefault(instruction.args[1].get_register_name(), []).append(statement)
+        elif instruction.name == "load" and instruction.args[0].is_register():
+            loads.setdefault(instruction.args[0].get_register_name(), []).append(statement)
+
+    def dominates(statement: LLVMStatement, other: LLVMStatement) -> bool:
+        block, index = positions[id(statement)]
+        other_block, other_index = positions[id(other)]
+
+        if block == other_block:
+            return index < other_index
+        return block in dominators[other_block]
+
+    removed: set[int] = set()
+
+    for slot, slot_stores in stores.items():
+        if slot not in local_slots or len(slot_stores) != 1:
+            continue
+        store = slot_stores[0]
+        value = store.get_instruction().args[0]
+        slot_loads = loads.get(slot, [])
+
+        if not value.is_constant() or not all(dominates(store, load) for load in slot_loads):
+            continue
+
+        for load in slot_loads:
+            _replace_register(function.statements, load.get_assignment_target(), value)
+        # the variable is no longer used at all
+        removed.update(id(statement) for statement in slot_loads + [store, allocas[slot]])
+    
+    function.statements = [statement for statement in function.statements if id(statement) not in removed]
+
+def inline_functions(functions: list[LLVMFunction], max_size: int = INLINE_MAX_SIZE, max_depth: int = INLINE_MAX_DEPTH) -> list[InlineDecision]:
+    """
+    Inline calls to small, non-recursive functions into every function in [functions],
+    modifying them in place, and return the decision made for each call site
+    """
+
+    inliner = _Inliner(functions, max_size, max_depth)
+
+    for function in functions:
+        inliner.inline_calls(function)
+
+    return inliner.decisions
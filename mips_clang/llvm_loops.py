@@ -0,0 +1,603 @@
+"""
+Loop optimizations over the control flow graph of an `LLVMFunction`: loop-invariant code
+motion and strength reduction of induction-variable address computations.
+
+Clang is invoked without optimizations, so local variables live in memory allocated by
+`alloca` and every loop iteration re-loads them. An "induction variable" is therefore an
+`alloca` whose only store inside the loop increments it by a constant.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Optional
+from .llvm_parse import LLVMFunction, LLVMInstruction, LLVMStatement, LLVMSymbol, LLVMType, get_sizeof
+from .util import unwrap
+
+PURE_INSTRUCTIONS = [
+    "add", "sub", "mul", "and", "or", "xor", "shl", "ashr", "lshr", "icmp",
+    "sext", "zext", "trunc", "bitcast", "ptrtoint", "inttoptr", "getelementptr"
+]
+"""Instructions without side effects that can never trap (divisions are excluded)"""
+
+TERMINATORS = ["br", "switch", "ret"]
+
+INSTRUCTION_COSTS = {"load": 2, "store": 2, "getelementptr": 5}
+"""Approximate number of MIPS instructions each LLVM instruction is translated to"""
+
+DEFAULT_INSTRUCTION_COST = 4
+
+ENTRY_BLOCK = ""
+"""Name used for the (unlabeled) entry block of a function"""
+
+@dataclass
+class LoopOptimizationStats:
+    loops: int = 0
+    hoisted: int = 0
+    """Number of loop-invariant instructions moved into loop preheaders"""
+
+    strength_reduced: int = 0
+    """Number of induction-variable computations replaced by incremented variables"""
+
+@dataclass
+class BasicBlock:
+    label: str
+    statements: list[LLVMStatement]
+    """Statements of the block, excluding its label"""
+
+    def get_terminator(self) -> Optional[LLVMInstruction]:
+        if not self.statements:
+            return None
+
+        instruction = self.statements[-1].get_instruction()
+        return instruction if instruction.name in TERMINATORS else None
+
+    def get_successors(self) -> list[str]:
+        terminator = self.get_terminator()
+        if not terminator:
+            return []
+
+        return [arg.get_register_name() for arg in terminator.args if arg.get_type().type_name == "label"]
+
+@dataclass
+class _Loop:
+    header: str
+    body: set[str]
+    """Labels of every block in the loop, including the header"""
+
+@dataclass
+class _InductionVariable:
+    slot: str
+    """Register name of the `alloca` holding the variable"""
+
+    step: int
+    update: LLVMStatement
+    """The store that increments the variable"""
+
+@dataclass
+class _AffineValue:
+    """
+    A value of the form `base + scale * i` inside a loop, for an induction variable `i`
+    and some loop-invariant `base`. For pointers, `scale` is in bytes.
+    """
+
+    variable: _InductionVariable
+    scale: int
+    is_pointer: bool
+    chain: list[LLVMStatement]
+    """The statements inside the loop that compute this value, in program order"""
+
+def split_blocks(statements: list[LLVMStatement]) -> list[BasicBlock]:
+    blocks = [BasicBlock(label=ENTRY_BLOCK, statements=[])]
+
+    for statement in statements:
+        if statement.is_label():
+            blocks.append(BasicBlock(label=statement.get_label_name(), statements=[]))
+        else:
+            blocks[-1].statements.append(statement)
+
+    return blocks
+
+def join_blocks(blocks: list[BasicBlock]) -> list[LLVMStatement]:
+    statements: list[LLVMStatement] = []
+
+    for block in blocks:
+        if block.label != ENTRY_BLOCK:
+            statements.append(LLVMStatement.from_label(block.label))
+        statements.extend(block.statements)
+
+    return statements
+
+def find_predecessors(blocks: list[BasicBlock]) -> dict[str, list[str]]:
+    predecessors: dict[str, list[str]] = {block.label: [] for block in blocks}
+
+    for block in blocks:
+        for successor in block.get_successors():
+            predecessors[successor].append(block.label)
+
+    return predecessors
+
+def find_dominators(blocks: list[BasicBlock]) -> dict[str, set[str]]:
+    """Return the set of blocks that dominate each block"""
+
+    all_labels = {block.label for block in blocks}
+    predecessors = find_predecessors(blocks)
+
+    dominators = {label: set(all_labels) for label in all_labels}
+    dominators[ENTRY_BLOCK] = {ENTRY_BLOCK}
+    changed = True
+
+    while changed:
+        changed = False
+
+        for block in blocks[1:]:
+            incoming = [dominators[p] for p in predecessors[block.label]]
+            new = set.intersection(*incoming) if incoming else set()
+            new.add(block.label)
+
+            if new != dominators[block.label]:
+                dominators[block.label] = new
+                changed = True
+
+    return dominators
+
+def _find_loops(blocks: list[BasicBlock]) -> list[_Loop]:
+    """
+    Find the natural loops of a function from its back edges (branches to a block that
+    dominates the branching block), innermost loops first
+    """
+
+    dominators = find_dominators(blocks)
+    predecessors = find_predecessors(blocks)
+    loops: dict[str, _Loop] = {}
+
+    for block in blocks:
+        for successor in block.get_successors():
+            if successor not in dominators[block.label]:
+                continue
+
+            # the loop consists of the header and every block that can reach the back
+            # edge without passing through the header
+            loop = loops.setdefault(successor, _Loop(header=successor, body={successor}))
+            worklist = [block.label]
+
+            while worklist:
+                label = worklist.pop()
+                if label in loop.body:
+                    continue
+                loop.body.add(label)
+                worklist.extend(predecessors[label])
+
+    return sorted(loops.values(), key=lambda loop: len(loop.body))
+
+def _used_registers(instruction: LLVMInstruction) -> list[str]:
+    return [arg.get_register_name() for arg in instruction.args if arg.is_register()]
+
+def _is_assigned(statement: LLVMStatement) -> bool:
+    return not statement.is_label() and statement.is_assignment()
+
+def find_local_slots(statements: list[LLVMStatement]) -> set[str]:
+    """
+    Return the registers assigned by `alloca` whose address never escapes, i.e. which
+    are only used as the address operand of `load` and `store`. Memory behind these
+    registers can only change through stores that name them directly.
+    """
+
+    slots = {
+        statement.get_assignment_target().get_register_name()
+        for statement in statements
+        if _is_assigned(statement) and statement.get_instruction().name == "alloca"
+    }
+
+    for statement in statements:
+        if statement.is_label():
+            continue
+        instruction = statement.get_instruction()
+
+        if instruction.name == "load":
+            continue
+        escaping = instruction.args[:1] if instruction.name == "store" else instruction.args
+        slots -= {arg.get_register_name() for arg in escaping if arg.is_register()}
+
+    return slots
+
+class _LoopOptimizer:
+    function: LLVMFunction
+    stats: LoopOptimizationStats
+    _name_count: int
+
+    def __init__(self, function: LLVMFunction) -> None:
+        self.function = function
+        self.stats = LoopOptimizationStats()
+        self._name_count = 0
+
+    def new_register(self, type_string: str) -> LLVMSymbol:
+        self._name_count += 1
+        return LLVMSymbol.from_argument("{} %__loop{}".format(type_string, self._name_count))
+
+    def optimize(self) -> LoopOptimizationStats:
+        blocks = split_blocks(self.function.statements)
+        done: set[str] = set()
+
+        # transforming a loop may add blocks, so loops are found again after each one
+        while True:
+            loop = next((loop for loop in _find_loops(blocks) if loop.header not in done), None)
+            if not loop:
+                break
+
+            done.add(loop.header)
+            preheader = self.get_preheader(blocks, loop)
+            self.stats.loops += 1
+
+            if preheader:
+                self.hoist_invariants(blocks, loop, preheader)
+                self.reduce_strength(blocks, loop, preheader)
+
+        self.function.statements = join_blocks(blocks)
+        return self.stats
+
+    def get_preheader(self, blocks: list[BasicBlock], loop: _Loop) -> Optional[BasicBlock]:
+        """
+        Return the block through which the loop is entered, inserting a new one before the
+        loop header if there is no unique such block
+        """
+
+        header_index = next(i for i, block in enumerate(blocks) if block.label == loop.header)
+        entering = [
+            block for block in blocks
+            if block.label not in loop.body and loop.header in block.get_successors()
+        ]
+
+        if len(entering) == 1:
+            terminator = entering[0].get_terminator()
+            if terminator and terminator.name == "br" and len(terminator.args) == 1:
+                return entering[0]
+
+        if not entering:
+            return None
+
+        preheader = BasicBlock(
+            label="__preheader_" + loop.header,
+            statements=[LLVMStatement.from_instruction(LLVMInstruction(
+                name="br",
+                args=[LLVMSymbol.from_argument("label %" + loop.header)]
+            ))]
+        )
+
+        # redirect branches from outside the loop to the new preheader
+        for block in entering:
+            terminator = unwrap(block.get_terminator())
+            terminator.args = [
+                LLVMSymbol.from_argument("label %" + preheader.label)
+                if arg.get_type().type_name == "label" and arg.get_register_name() == loop.header else arg
+                for arg in terminator.args
+            ]
+
+        blocks.insert(header_index, preheader)
+        return preheader
+
+    def get_loop_statements(self, blocks: list[BasicBlock], loop: _Loop) -> list[LLVMStatement]:
+        return [statement for block in blocks if block.label in loop.body for statement in block.statements]
+
+    def hoist_invariants(self, blocks: list[BasicBlock], loop: _Loop, preheader: BasicBlock) -> None:
+        statements = self.get_loop_statements(blocks, loop)
+        local_slots = find_local_slots(self.function.statements)
+
+        defined_in_loop = {s.get_assignment_target().get_register_name() for s in statements if _is_assigned(s)}
+        stored_slots: set[str] = set()
+        # whether the loop may write to memory other than local slots
+        writes_memory = False
+
+        for statement in statements:
+            instruction = statement.get_instruction()
+            if instruction.name == "store" and instruction.args[1].is_register() \
+                    and instruction.args[1].get_register_name() in local_slots:
+                stored_slots.add(instruction.args[1].get_register_name())
+            elif instruction.name not in PURE_INSTRUCTIONS + TERMINATORS + ["load", "alloca"]:
+                writes_memory = True
+
+        def is_invariant(symbol: LLVMSymbol) -> bool:
+            return not symbol.is_register() or symbol.get_register_name() not in defined_in_loop
+
+        def can_hoist(instruction: LLVMInstruction) -> bool:
+            if not all(is_invariant(arg) for arg in instruction.args):
+                return False
+            if instruction.name in PURE_INSTRUCTIONS:
+                return True
+            if instruction.name != "load":
+                return False
+
+            # loads are only hoisted from memory that is always valid to read (so that
+            # reading it before the loop is safe) and that the loop does not write to
+            pointer = instruction.args[0]
+            if pointer.is_register() and pointer.get_register_name() in local_slots:
+                return pointer.get_register_name() not in stored_slots
+
+            return pointer.is_global() and not writes_memory
+
+        hoisted: list[LLVMStatement] = []
+        changed = True
+
+        while changed:
+            changed = False
+
+            for block in blocks:
+                if block.label not in loop.body:
+                    continue
+
+                for statement in list(block.statements):
+                    if not _is_assigned(statement) or not can_hoist(statement.get_instruction()):
+                        continue
+
+                    block.statements.remove(statement)
+                    hoisted.append(statement)
+                    defined_in_loop.remove(statement.get_assignment_target().get_register_name())
+                    changed = True
+
+        preheader.statements[-1:-1] = hoisted
+        self.stats.hoisted += len(hoisted)
+
+    def find_induction_variables(self, statements: list[LLVMStatement]) -> dict[str, _InductionVariable]:
+        """
+        Return the local slots (by register name) that are stored to exactly once in the
+        loop, with the value of a load from the same slot plus a constant
+        """
+
+        local_slots = find_local_slots(self.function.statements)
+        definitions = {s.get_assignment_target().get_register_name(): s for s in statements if _is_assigned(s)}
+        stores: dict[str, list[LLVMStatement]] = {}
+        variables: dict[str, _InductionVariable] = {}
+
+        for statement in statements:
+            instruction = statement.get_instruction()
+            if instruction.name == "store" and instruction.args[1].is_register():
+                stores.setdefault(instruction.args[1].get_register_name(), []).append(statement)
+
+        def loads_from(symbol: LLVMSymbol, slot: str) -> bool:
+            if not symbol.is_register() or symbol.get_register_name() not in definitions:
+                return False
+            instruction = definitions[symbol.get_register_name()].get_instruction()
+            return instruction.name == "load" and instruction.args[0].is_register() \
+                and instruction.args[0].get_register_name() == slot
+
+        for slot, slot_stores in stores.items():
+            if slot not in local_slots or len(slot_stores) != 1:
+                continue
+
+            stored_value = slot_stores[0].get_instruction().args[0]
+            if not stored_value.is_register() or stored_value.get_register_name() not in definitions:
+                continue
+            increment = definitions[stored_value.get_register_name()].get_instruction()
+            if increment.name not in ("add", "sub"):
+                continue
+
+            left, right = increment.args
+            if increment.name == "add" and left.is_constant():
+                left, right = right, left
+            if not right.is_constant() or not loads_from(left, slot):
+                continue
+
+            step = right.get_constant_value() * (1 if increment.name == "add" else -1)
+            variables[slot] = _InductionVariable(slot=slot, step=step, update=slot_stores[0])
+
+        return variables
+
+    def find_affine_values(self, statements: list[LLVMStatement], variables: dict[str, _InductionVariable]) -> dict[str, _AffineValue]:
+        """Return the values assigned in the loop that are affine in an induction variable"""
+
+        defined_in_loop = {s.get_assignment_target().get_register_name() for s in statements if _is_assigned(s)}
+        affine: dict[str, _AffineValue] = {}
+
+        def is_invariant(symbol: LLVMSymbol) -> bool:
+            return not symbol.is_register() or symbol.get_register_name() not in defined_in_loop
+
+        def get_affine(symbol: LLVMSymbol) -> Optional[_AffineValue]:
+            return affine.get(symbol.get_register_name()) if symbol.is_register() else None
+
+        for statement in statements:
+            if not _is_assigned(statement):
+                continue
+            instruction = statement.get_instruction()
+            args = instruction.args
+            # the affine operand of the instruction and the scale of the result
+            operand: Optional[_AffineValue] = None
+            scale = 0
+            is_pointer = False
+
+            if instruction.name == "load" and args[0].is_register() and args[0].get_register_name() in variables:
+                value = _AffineValue(variables[args[0].get_register_name()], scale=1, is_pointer=False, chain=[statement])
+                affine[statement.get_assignment_target().get_register_name()] = value
+                continue
+            elif instruction.name in ("add", "sub", "mul", "shl"):
+                left, right = args
+                if instruction.name in ("add", "mul") and get_affine(right):
+                    left, right = right, left
+                operand = get_affine(left)
+
+                if not operand or operand.is_pointer or not is_invariant(right):
+                    operand = None
+                elif instruction.name in ("add", "sub"):
+                    scale = operand.scale
+                elif right.is_constant():
+                    factor = right.get_constant_value()
+                    scale = operand.scale * (factor if instruction.name == "mul" else 1 << factor)
+                else:
+                    operand = None
+            elif instruction.name == "getelementptr":
+                affine_args = [i for i, arg in enumerate(args) if get_affine(arg)]
+                if len(affine_args) != 1 or not all(is_invariant(arg) for i, arg in enumerate(args) if i != affine_args[0]):
+                    continue
+                position = affine_args[0]
+                operand = get_affine(args[position])
+                is_pointer = True
+
+                # find the size of the objects the affine index steps over
+                indexed_type = unwrap(instruction.associated_type)
+                for _ in range(max(position - 1, 0)):
+                    indexed_type = unwrap(indexed_type.element_type)
+
+                if position == 0 and unwrap(operand).is_pointer:
+                    scale = unwrap(operand).scale
+                elif position > 0 and not unwrap(operand).is_pointer:
+                    scale = unwrap(operand).scale * get_sizeof(indexed_type)
+                else:
+                    operand = None
+
+            if operand:
+                affine[statement.get_assignment_target().get_register_name()] = _AffineValue(
+                    operand.variable,
+                    scale=scale,
+                    is_pointer=is_pointer,
+                    chain=operand.chain + [statement]
+                )
+
+        return affine
+
+    def reduce_strength(self, blocks: list[BasicBlock], loop: _Loop, preheader: BasicBlock) -> None:
+        """
+        Replace pointers computed from an induction variable (e.g. with
+        `getelementptr i32, i32* %base, i32 %i`) with a pointer variable that is initialized
+        in the preheader and incremented alongside the induction variable, where doing so
+        removes more instructions than the increment adds
+        """
+
+        statements = self.get_loop_statements(blocks, loop)
+        variables = self.find_induction_variables(statements)
+        if not variables:
+            return
+
+        affine = self.find_affine_values(statements, variables)
+        uses: dict[str, list[LLVMStatement]] = {}
+
+        for statement in self.function.statements:
+            if not statement.is_label():
+                for name in _used_registers(statement.get_instruction()):
+                    uses.setdefault(name, []).append(statement)
+
+        def get_cost(statement: LLVMStatement) -> int:
+            return INSTRUCTION_COSTS.get(statement.get_instruction().name, DEFAULT_INSTRUCTION_COST)
+
+        # the block and position of every statement in the loop
+        positions: dict[int, tuple[str, int]] = {
+            id(statement): (block.label, i)
+            for block in blocks if block.label in loop.body
+            for i, statement in enumerate(block.statements)
+        }
+
+        def sees_same_value(value: _AffineValue) -> bool:
+            """
+            Return whether the pointer variable, which is incremented right after the
+            induction variable is, holds the pointer computed from the value the chain loaded.
+            This is not the case if the induction variable is incremented between the load
+            and the pointer computation (e.g. `buf[(i++) * 2]`).
+            """
+
+            load_block, load_index = positions[id(value.chain[0])]
+            root_block, root_index = positions[id(value.chain[-1])]
+            update_block, update_index = positions[id(value.variable.update)]
+
+            if load_block != root_block:
+                # the update could run between them
+                return False
+            return update_block != load_block or not load_index < update_index < root_index
+
+        # a load, a "getelementptr" with a constant index and a store
+        update_cost = INSTRUCTION_COSTS["load"] + 3 + INSTRUCTION_COSTS["store"]
+        replaced: set[str] = set()
+
+        for name, value in affine.items():
+            # only pointers that are used by something other than another affine
+            # computation are kept in their own variable
+            if not value.is_pointer or all(
+                use.is_assignment() and use.get_assignment_target().get_register_name() in affine
+                for use in uses.get(name, [])
+            ):
+                continue
+            if any(s.get_assignment_target().get_register_name() in replaced for s in value.chain):
+                continue
+            if not sees_same_value(value):
+                continue
+
+            # computations that are only used within the chain are no longer needed once
+            # the pointer is kept in its own variable
+            removed = [value.chain[-1]]
+            for statement in reversed(value.chain[:-1]):
+                if all(use in removed for use in uses.get(statement.get_assignment_target().get_register_name(), [])):
+                    removed.append(statement)
+
+            if sum(get_cost(s) for s in removed) - INSTRUCTION_COSTS["load"] - update_cost <= 0:
+                continue
+
+            self.replace_with_variable(blocks, preheader, value, removed)
+            replaced.add(name)
+            self.stats.strength_reduced += 1
+
+    def replace_with_variable(self, blocks: list[BasicBlock], preheader: BasicBlock, value: _AffineValue, removed: list[LLVMStatement]) -> None:
+        root = value.chain[-1]
+        root_target = root.get_assignment_target()
+        # assignment targets are untyped, and only the size of the pointer matters
+        pointer_type = "i8*"
+        slot = self.new_register(pointer_type + "*")
+
+        def assign(target: LLVMSymbol, instruction: LLVMInstruction) -> LLVMStatement:
+            return LLVMStatement.from_assignment(to=target, instruction=instruction)
+
+        def store(stored: LLVMSymbol, to: LLVMSymbol) -> LLVMStatement:
+            return LLVMStatement.from_instruction(LLVMInstruction(name="store", args=[stored, to]))
+
+        # the initial value is computed in the preheader by a copy of the chain, which reads
+        # the value of the induction variable before the loop
+        initialization = [assign(slot, LLVMInstruction(name="alloca", associated_type=LLVMType(pointer_type)))]
+        renamed: dict[str, LLVMSymbol] = {}
+
+        for statement in value.chain:
+            instruction = statement.get_instruction()
+            target = statement.get_assignment_target()
+            renamed[target.get_register_name()] = self.new_register(
+                pointer_type if instruction.name == "getelementptr" else "i32"
+            )
+
+            initialization.append(assign(renamed[target.get_register_name()], LLVMInstruction(
+                name=instruction.name,
+                mode=instruction.mode,
+                associated_type=instruction.associated_type,
+                args=[
+                    renamed[arg.get_register_name()] if arg.is_register() and arg.get_register_name() in renamed else arg
+                    for arg in instruction.args
+                ]
+            )))
+
+        initialization.append(store(renamed[root_target.get_register_name()], slot))
+        preheader.statements[-1:-1] = initialization
+
+        # increment the pointer right after the induction variable is incremented
+        current = self.new_register(pointer_type)
+        incremented = self.new_register(pointer_type)
+        update = [
+            assign(current, LLVMInstruction(name="load", associated_type=LLVMType(pointer_type), args=[slot])),
+            assign(incremented, LLVMInstruction(name="getelementptr", associated_type=LLVMType("i8"), args=[
+                current, LLVMSymbol.from_argument("i32 {}".format(value.scale * value.variable.step))
+            ])),
+            store(incremented, slot)
+        ]
+
+        for block in blocks:
+            if value.variable.update in block.statements:
+                index = block.statements.index(value.variable.update)
+                block.statements[index + 1:index + 1] = update
+
+            if root in block.statements:
+                block.statements[block.statements.index(root)] = assign(
+                    root_target,
+                    LLVMInstruction(name="load", associated_type=LLVMType(pointer_type), args=[slot])
+                )
+
+            block.statements = [s for s in block.statements if s not in removed[1:]]
+
+def optimize_loops(function: LLVMFunction) -> LoopOptimizationStats:
+    """
+    Hoist loop-invariant loads and computations into loop preheaders and replace
+    address computations on induction variables with incremented pointers. [function] is
+    modified in place.
+    """
+
+    return _LoopOptimizer(function).optimize()
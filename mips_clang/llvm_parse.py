@@ -1,12 +1,23 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Optional
 from .util import ltrim, ltrim_regex, rtrim, unwrap, with_unix_endl
+import numpy as np
 import re
 
 TYPE_PATTERN = r'\w+\*{0,}'
 FUNCTION_PATTERN = r'@\w+'
 REGISTR_PATTERN = r'%\w+'
+GLOBAL_PATTERN = r'@[\w.$]+'
+
+BINARY_OPERATORS = ["add", "sub", "mul", "sdiv", "udiv", "srem", "urem", "and", "or", "xor", "shl", "ashr", "lshr"]
+CAST_OPERATORS = ["sext", "zext", "trunc", "bitcast", "ptrtoint", "inttoptr"]
+# attributes of call arguments and function parameters, which don't affect the translation
+ATTRIBUTE_PATTERN = (
+    r'\b(noundef|signext|zeroext|nonnull|noalias|nocapture|readonly|writeonly|readnone|inreg|'
+    r'returned|nofree|immarg|align \d+|dereferenceable(_or_null)?\(\d+\)|(byval|sret)\([^)]*\)) '
+)
 
 @dataclass
 class LLVMInstruction:
@@ -15,12 +26,46 @@ class LLVMInstruction:
     associated_type: Optional[LLVMType] = None
     args: list[LLVMSymbol] = field(default_factory=list)
 
+    def __reduce__(self):
+        # pickled as a plain tuple, see `LLVMType.__reduce__`
+        return (LLVMInstruction, (self.name, self.mode, self.associated_type, self.args))
 
 @dataclass
 class LLVMFunction:
     statements: list[LLVMStatement]
     return_type: LLVMType
     name: str
+    parameters: list[LLVMSymbol] = field(default_factory=list)
+
+@dataclass
+class LLVMGlobal:
+    """
+    Example:
+    ```
+    @table = dso_local global [4 x i32] [i32 1, i32 2, i32 3, i32 4], align 4
+    ```
+
+    The initializer is stored as a flat array of element values (nested arrays are
+    flattened in row-major order) instead of as `LLVMSymbol` objects, so that large
+    lookup tables and sprite sheets can be parsed in bulk.
+    """
+
+    name: str
+    element_type: LLVMType
+    data: np.ndarray
+    align: Optional[int] = None
+
+    addresses: dict[int, LLVMSymbol] = field(default_factory=dict)
+    """
+    Maps the indices of elements initialized with the address of a global (e.g.
+    `i8* getelementptr inbounds ([6 x i8], [6 x i8]* @.str, i32 0, i32 0)`) to that
+    global; the value of these elements in [data] is `0`
+    """
+
+@dataclass
+class LLVMModule:
+    functions: list[LLVMFunction]
+    globals: list[LLVMGlobal]
 
 @dataclass
 class LLVMStatement:
@@ -67,6 +112,9 @@ class LLVMStatement:
     
     def is_label(self) -> bool:
         return self._label is not None
+
+    def __reduce__(self):
+        return (LLVMStatement, (self._assign_to, self._instruction, self._label))
     
 
 class LLVMType:
@@ -79,10 +127,27 @@ class LLVMType:
     `2` if this type is a pointer to a pointer, and so on.
     """
 
+    array_length: int
+    element_type: Optional[LLVMType]
+    """For array types (e.g. `[10 x i32]`), the length and type of the elements"""
+
     def __init__(self, from_type_string: str) -> None:
         from_type_string = from_type_string.strip()
+        self.array_length = 0
+        self.element_type = None
+
+        # for instance, separate "[10 x i32]*" into "10", "i32" and "*"
+        array_match = re.match(r'\[(\d+) x (.*)\](\**)$', from_type_string)
+        if array_match:
+            self.type_name = "array"
+            self.array_length = int(array_match[1])
+            self.element_type = LLVMType(array_match[2])
+            self.pointer = len(array_match[3])
+            return
+
         # for instance, separate "i32**" into "i32" and "**"
-        self.type_name, other = unwrap(ltrim_regex(from_type_string, r'\w+'))
+        # named struct types (e.g. "%struct.point*") are only used behind pointers
+        self.type_name, other = unwrap(ltrim_regex(from_type_string, r'%?[\w.]+'))
         
         self.pointer = other.count("*")
     
@@ -92,11 +157,53 @@ class LLVMType:
     
     def is_any(self) -> bool:
         return self.type_name == "any"
+    
+    def is_array(self) -> bool:
+        return self.type_name == "array" and not self.pointer
+    
+    def as_type_string(self) -> str:
+        """Return this type as it would be written in LLVM IR (e.g. `"[10 x i32]*"`)"""
+
+        if self.type_name == "array":
+            base = "[{} x {}]".format(self.array_length, unwrap(self.element_type).as_type_string())
+        else:
+            base = self.type_name
+        
+        return base + "*" * self.pointer
 
     def __str__(self) -> str:
-        return "<LLVMType {}>".format(self.type_name+("*"*self.pointer))
+        return "<LLVMType {}>".format(self.as_type_string())
+
+    def __reduce__(self):
+        # functions are pickled to be translated in worker processes (see
+        # `llvm_translate`), and a module has hundreds of thousands of types and symbols.
+        # types are pickled as their type string and shared again when unpickled, which
+        # makes pickles several times smaller and faster to load than the default
+        # attribute dictionaries
+        return (_type_from_string, (self.as_type_string(),))
+
+@lru_cache(maxsize=None)
+def _type_from_string(type_string: str) -> LLVMType:
+    return LLVMType(type_string)
         
 
+def get_sizeof(type: LLVMType) -> int:
+    """Return the size of the given type in bytes"""
+
+    if type.pointer or type.type_name == "ptr":
+        # MARS uses MIPS32
+        return 4
+    if type.is_array():
+        return type.array_length * get_sizeof(unwrap(type.element_type))
+    if type.type_name == "i32":
+        return 4
+    if type.type_name == "i16":
+        return 2
+    if type.type_name == "i8":
+        return 1
+    
+    raise ValueError("Unrecognized type \"{}\"".format(type.type_name))
+
 REGISTER = 0
 CONSTANT = 1
 GLOBAL = 2
@@ -106,8 +213,12 @@ class LLVMSymbol:
     _type: LLVMType
     _symbol_type: int
 
+    _offset: int
+    """For globals, the offset in bytes from the start of the global (see `get_global_offset`)"""
+
     def __init__(self, type: LLVMType, symbol_str: str) -> None:
         self._type = type
+        self._offset = 0
 
         if symbol_str.startswith("%"):
             symbol_str = ltrim(symbol_str, "%")
@@ -130,9 +241,27 @@ class LLVMSymbol:
             raise ValueError("Symbol is not a register")
         return self._content
     
+    def get_global_name(self) -> str:
+        if not self.is_global():
+            raise ValueError("Symbol is not a global")
+        return self._content
+
+    def get_global_offset(self) -> int:
+        """
+        Return the offset in bytes this symbol points to from the start of its global, which
+        is not `0` for constant `getelementptr` expressions (e.g.
+        `i32* getelementptr inbounds ([4 x i32], [4 x i32]* @table, i32 0, i32 2)`)
+        """
+
+        if not self.is_global():
+            raise ValueError("Symbol is not a global")
+        return self._offset
+    
     def get_constant_value(self) -> int:
         if not self.is_constant():
             raise ValueError("Symbol is not a constant")
+        if self._content in ("true", "false"):
+            return int(self._content == "true")
         
         return eval(self._content)
     
@@ -147,6 +276,9 @@ class LLVMSymbol:
     
     def get_type(self) -> LLVMType:
         return self._type
+
+    def __reduce__(self):
+        return (_symbol_from_parts, (self._type.as_type_string(), self._content, self._symbol_type, self._offset))
     
     @staticmethod
     def from_argument(argument_string: str, disallow_any=False) -> LLVMSymbol:
@@ -158,8 +290,22 @@ class LLVMSymbol:
         - `"i32 0"`
         - `"32"`
         - `"i32* inttoptr (i32 4 to i32*)"`
+        - `"[100 x i32]* bitcast (<{ [3 x i32], [97 x i32] }>* @table to [100 x i32]*)"`
+        - `"i8* getelementptr inbounds ([3 x i8], [3 x i8]* @.str, i32 0, i32 0)"`
         """
 
+        # constant expressions, e.g. "i32* inttoptr (i32 4 to i32*)"; the first keyword
+        # after the type is the outermost expression
+        expression_match = "(" in argument_string and re.match(
+            r'(.+?) (inttoptr|bitcast|getelementptr) (?:inbounds )?\((.*)\)$', argument_string
+        )
+        if expression_match:
+            return LLVMSymbol.from_constant_expression(expression_match[1], expression_match[2], expression_match[3])
+
+        if argument_string.startswith("["): # e.g. "[10 x i32]* %2"
+            type_string, name = argument_string.rsplit(" ", 1)
+            return LLVMSymbol(LLVMType(type_string), name)
+
         parts = argument_string.split(" ")
         if len(parts) == 1:
             if disallow_any: raise ValueError("Invalid argument string \"{}\" (any not allowed)".format(argument_string))
@@ -167,27 +313,284 @@ class LLVMSymbol:
         if len(parts) == 2:
             type, name = parts
             return LLVMSymbol(LLVMType(type), name)
-        if parts[1] == "inttoptr": # e.g. "i32* inttoptr (i32 4 to i32*)"
-            # separate "i32*" from "inttopotr (..."
-            type_string, argument_string = unwrap(ltrim_regex(argument_string, TYPE_PATTERN))
-            argument_string = argument_string.strip()
 
-            # remove "inttoptr"
-            argument_string = ltrim(argument_string, "inttoptr").strip()
-            # find and remove parentheses
-            assert argument_string.startswith("(") and argument_string.endswith(")")
-            argument_string = argument_string[1:-1]
+        raise ValueError("Invalid argument string \"{}\"".format(argument_string))
 
+    @staticmethod
+    def from_constant_expression(type_string: str, operator: str, operands_string: str) -> LLVMSymbol:
+        """
+        Turn a constant expression into an `LLVMSymbol` of type [type_string], given the
+        text between its parentheses. For instance, `"i32* getelementptr inbounds ([4 x i32],
+        [4 x i32]* @table, i32 0, i32 2)"` is passed as `"i32*"`, `"getelementptr"` and
+        `"[4 x i32], [4 x i32]* @table, i32 0, i32 2"`, and becomes the global `@table`
+        with an offset of 8 bytes.
+        """
+
+        if operator == "inttoptr":
             # split conversions ("i32 4 to i32*" to ["i32 4", "i32*"])
-            int_symbol, ptr_type = argument_string.split(" to ")
+            int_symbol, ptr_type = operands_string.split(" to ")
             int_value = LLVMSymbol.from_argument(int_symbol).get_constant_value()
             return LLVMSymbol(LLVMType(ptr_type), str(int_value))
 
-        raise ValueError("Invalid argument string \"{}\"".format(argument_string))
+        if operator == "bitcast":
+            # e.g. globals that clang declares as packed structs, as in
+            # "bitcast (<{ [3 x i32], [97 x i32] }>* @table to [100 x i32]*)"
+            value_string, _ = operands_string.rsplit(" to ", 1)
+            if "(" in value_string:
+                value = LLVMSymbol.from_argument(value_string)
+            else:
+                value = LLVMSymbol(LLVMType.any(), value_string.rsplit(" ", 1)[1])
+        else:
+            # the source element type, the base pointer and the indices, as in the
+            # "getelementptr" instruction
+            source_type_string, base_string, *indices = _split_top_level(operands_string)
+            value = LLVMSymbol.from_argument(base_string)
+            indexed_type = LLVMType(source_type_string)
+
+            for i, index in enumerate(indices):
+                if i > 0:
+                    indexed_type = unwrap(indexed_type.element_type)
+                value._offset += LLVMSymbol.from_argument(index).get_constant_value() * get_sizeof(indexed_type)
+
+        if not value.is_global():
+            raise ValueError("Unsupported constant expression \"{} ({})\"".format(operator, operands_string))
+        
+        symbol = LLVMSymbol(LLVMType(type_string), "@" + value.get_global_name())
+        symbol._offset = value._offset
+        return symbol
+
+def _symbol_from_parts(type_string: str, content: str, symbol_type: int, offset: int) -> LLVMSymbol:
+    symbol = LLVMSymbol.__new__(LLVMSymbol)
+    symbol._type = _type_from_string(type_string)
+    symbol._content = content
+    symbol._symbol_type = symbol_type
+    symbol._offset = offset
+    return symbol
+
+def _split_array_type(type_string: str) -> tuple[int, LLVMType, str]:
+    """
+    Separate a (possibly nested) array type from the text following it, returning the
+    total number of scalar elements, the scalar element type, and the remaining text.
+
+    For instance, `"[4 x [2 x i32]] zeroinitializer"` becomes `(8, i32, " zeroinitializer")`.
+    """
+
+    count = 1
+    depth = 0
+
+    while True:
+        match = re.match(r'\[(\d+) x ', type_string)
+        if not match:
+            break
+        count *= int(match[1])
+        depth += 1
+        type_string = type_string[match.end():]
+
+    element_type_string, type_string = unwrap(ltrim_regex(type_string, TYPE_PATTERN))
+    
+    # remove the closing brackets of each array dimension
+    assert type_string.startswith("]" * depth)
+    type_string = type_string[depth:]
+
+    return count, LLVMType(element_type_string), type_string
+
+def _split_top_level(aggregate_string: str) -> list[str]:
+    """
+    Split the comma-separated elements of an aggregate initializer (without its outer
+    brackets) or of an argument list, ignoring commas nested inside inner brackets,
+    braces, the parentheses of constant expressions, or string literals
+    """
+
+    elements: list[str] = []
+    depth = 0
+    in_string = False
+    start = 0
+
+    for i, char in enumerate(aggregate_string):
+        if char == '"':
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif char in "[{(":
+            depth += 1
+        elif char in "]})":
+            depth -= 1
+        elif char == "," and depth == 0:
+            elements.append(aggregate_string[start:i].strip())
+            start = i + 1
+
+    elements.append(aggregate_string[start:].strip())
+    return elements
+
+def _decode_string_literal(literal: str) -> np.ndarray:
+    """
+    Decode an LLVM string constant (e.g. `c"hi\\0A\\00"`) into an array of signed byte values
+    """
+
+    assert literal.startswith('c"') and literal.endswith('"')
+    raw = literal[2:-1].encode("latin-1")
+    raw = re.sub(rb'\\([0-9A-Fa-f]{2})', lambda match: bytes([int(match[1], 16)]), raw)
+
+    # signed, like the elements of "[N x i8] [i8 -1, ...]" and the range MARS checks
+    # ".byte" values against
+    return np.frombuffer(raw, dtype=np.int8).astype(np.int64)
+
+_Initializer = tuple[np.ndarray, dict[int, LLVMSymbol]]
+"""The element values of (part of) a global initializer and its addresses (see `LLVMGlobal.addresses`)"""
+
+def _concatenate_initializers(parts: list[_Initializer]) -> _Initializer:
+    addresses: dict[int, LLVMSymbol] = {}
+    position = 0
+
+    for values, part_addresses in parts:
+        addresses.update((position + index, symbol) for index, symbol in part_addresses.items())
+        position += len(values)
+
+    return np.concatenate([values for values, _ in parts]), addresses
+
+def _parse_array_initializer(count: int, element_type: LLVMType, initializer: str) -> _Initializer:
+    """
+    Parse the initializer of an array with [count] scalar elements of [element_type] into
+    a flat array.
+
+    Plain lists of integers are parsed in a single pass over the initializer string;
+    everything else (nested arrays that contain `zeroinitializer` or string rows, and
+    pointers or constant expressions) is split element by element.
+    """
+
+    if initializer == "zeroinitializer":
+        return np.zeros(count, dtype=np.int64), {}
+    if initializer.startswith('c"'):
+        values, addresses = _decode_string_literal(initializer), {}
+    elif element_type.type_name.startswith("i") and not element_type.pointer and not any(
+        text in initializer for text in ("zeroinitializer", 'c"', "(", "@")
+    ):
+        # every scalar element is written as "<type> <value>"; types of nested rows
+        # (e.g. "[2 x i32] [") never match this pattern
+        values, addresses = np.array(re.findall(r'\bi\d+ (-?\d+)', initializer), dtype=np.int64), {}
+    else:
+        if not (initializer.startswith("[") and initializer.endswith("]")):
+            raise SyntaxError("Unsupported global initializer \"{}\"".format(initializer[:80]))
+        parts: list[_Initializer] = []
+
+        for element in _split_top_level(initializer[1:-1]):
+            if element.startswith("["):
+                row_count, row_element_type, row_initializer = _split_array_type(element)
+                parts.append(_parse_array_initializer(row_count, row_element_type, row_initializer.strip()))
+            else:
+                type_string, element_initializer = unwrap(ltrim_regex(element, TYPE_PATTERN))
+                parts.append(_parse_scalar_initializer(type_string, element_initializer.strip()))
+
+        values, addresses = _concatenate_initializers(parts)
+    
+    if len(values) != count:
+        raise SyntaxError("Unsupported global initializer \"{}\"".format(initializer[:80]))
+
+    return values, addresses
+
+def _parse_scalar_initializer(type_string: str, initializer: str) -> _Initializer:
+    if initializer in ("null", "zeroinitializer"):
+        return np.zeros(1, dtype=np.int64), {}
+    
+    symbol = LLVMSymbol.from_argument(type_string + " " + initializer)
+    if symbol.is_global():
+        return np.zeros(1, dtype=np.int64), {0: symbol}
+    if not symbol.is_constant():
+        raise SyntaxError("Unsupported global initializer \"{}\"".format(initializer))
+
+    return np.array([symbol.get_constant_value()], dtype=np.int64), {}
+
+def _get_layout(type_string: str, struct_types: dict[str, str]) -> tuple[int, int]:
+    """
+    Return the size and alignment in bytes of [type_string], which may be a struct type,
+    given the bodies of the named struct types (e.g. `"%struct.point": "{ i32, i32 }"`)
+    """
+
+    type_string = type_string.strip()
+
+    if type_string.startswith("%") and not type_string.endswith("*"):
+        if type_string not in struct_types:
+            raise SyntaxError("Unknown type \"{}\"".format(type_string))
+        return _get_layout(struct_types[type_string], struct_types)
+    if type_string.startswith("{") or type_string.startswith("<{"):
+        packed = type_string.startswith("<{")
+        fields = _split_top_level(type_string[2:-2] if packed else type_string[1:-1])
+        size = 0
+        align = 1
+
+        for field_type in fields:
+            if not field_type:
+                continue
+            field_size, field_align = _get_layout(field_type, struct_types)
+            if not packed:
+                # fields are aligned to their natural alignment, as on MIPS32
+                size = (size + field_align - 1) // field_align * field_align
+                align = max(align, field_align)
+            size += field_size
+
+        return (size + align - 1) // align * align, align
+    
+    array_match = re.match(r'\[(\d+) x (.*)\]$', type_string)
+    if array_match:
+        element_size, element_align = _get_layout(array_match[2], struct_types)
+        return int(array_match[1]) * element_size, element_align
+    
+    if type_string.endswith("*"):
+        # pointers to structs (e.g. "%struct.point*") are not parsed by LLVMType
+        return 4, 4
+    size = get_sizeof(LLVMType(type_string))
+    return size, size
+
+def _parse_struct_initializer(body: str) -> tuple[LLVMType, _Initializer]:
+    """
+    Parse the type and initializer of a global struct, such as
+    `<{ [3 x i32], [97 x i32] }> <{ [3 x i32] [...], [97 x i32] zeroinitializer }>`.
+
+    Clang writes arrays with a long run of trailing zeros as (packed) structs of the
+    initialized elements and a zero-initialized tail. Only structs whose fields all have
+    the same element type are supported, so that there is no padding between fields and
+    their elements can be concatenated.
+    """
+
+    match = re.match(r'(<?\{)(.*?)(\}>?) (.*)$', body)
+    if not match:
+        raise SyntaxError("Unsupported struct initializer")
+    
+    field_type_strings = _split_top_level(match[2])
+    initializer = match[4].strip()
+
+    if initializer == "zeroinitializer":
+        field_initializers = [field_type + " zeroinitializer" for field_type in field_type_strings]
+    elif initializer.startswith(match[1]) and initializer.endswith(match[3]):
+        field_initializers = _split_top_level(initializer[len(match[1]):-len(match[3])])
+    else:
+        raise SyntaxError("Unsupported struct initializer")
+    
+    element_type_string: Optional[str] = None
+    fields: list[_Initializer] = []
+
+    for field in field_initializers:
+        if field.startswith("["):
+            count, field_element_type, field_initializer = _split_array_type(field)
+            field_type_string = field_element_type.as_type_string()
+            fields.append(_parse_array_initializer(count, field_element_type, field_initializer.strip()))
+        else:
+            field_type_string, field_initializer = unwrap(ltrim_regex(field, TYPE_PATTERN))
+            fields.append(_parse_scalar_initializer(field_type_string, field_initializer.strip()))
+
+        if element_type_string not in (None, field_type_string):
+            raise SyntaxError("struct fields of different types")
+        element_type_string = field_type_string
+
+    return LLVMType(unwrap(element_type_string)), _concatenate_initializers(fields)
 
 class _LLVMParser:
     source: str
     _lines: list[str]
+    globals: list[LLVMGlobal]
+
+    struct_types: dict[str, str]
+    """Maps the names of struct types (e.g. `"%struct.point"`) to their bodies (e.g. `"{ i32, i32 }"`)"""
     
     _line_index: int
     """Stores the current line position in the file"""
@@ -196,6 +599,8 @@ class _LLVMParser:
         self.source = source
         self._lines = with_unix_endl(self.source).split("\n")
         self._line_index = 0
+        self.globals = []
+        self.struct_types = {}
     
     def next_line(self) -> bool:
         self._line_index += 1
@@ -223,11 +628,85 @@ class _LLVMParser:
             if line.startswith("define "):
                 function = self.parse_function_decl()
                 functions.append(function)
+            elif re.match(r'%[\w.]+ = type ', line):
+                # e.g. "%struct.point = type { i32, i32 }", which clang writes before
+                # the globals that use it
+                type_name, type_body = line.split(" = type ", 1)
+                self.struct_types[type_name] = type_body.strip()
+            elif line.startswith("@"):
+                global_decl = self.parse_global_decl(line)
+
+                if global_decl:
+                    self.globals.append(global_decl)
 
             self.next_line()
         
         return functions
     
+    def parse_global_decl(self, line: str) -> Optional[LLVMGlobal]:
+        """
+        Parse a global variable definition, such as
+        `"@__SCREEN_WIDTH = dso_local global i32 64, align 4"`.
+
+        Return `None` for external declarations, which have no initializer.
+        """
+
+        # separate "@name = <linkage...> global" from the type and initializer
+        match = re.match(r'(' + GLOBAL_PATTERN + r') = (.*?)\b(global|constant) ', line)
+        if not match:
+            raise SyntaxError("Unsupported global declaration \"{}\"".format(line[:80]))
+        
+        name = match[1]
+        if "external" in match[2].split(" "):
+            return None
+
+        body = line[match.end():]
+
+        # remove trailing attributes (e.g. ", align 4"), which are only looked for after
+        # the initializer, since string initializers may contain the same text
+        attributes_match = re.search(r'(, (align \d+|section "[^"]*"|!\w+ !\d+))+$', body)
+        attributes = attributes_match[0] if attributes_match else ""
+        align_match = re.search(r', align (\d+)', attributes)
+        body = body[:len(body) - len(attributes)]
+
+        try:
+            if body.startswith("%"):
+                # named struct types, e.g. "%struct.point { i32 1, i32 2 }"
+                type_name, initializer = body.split(" ", 1)
+                struct_body = self.struct_types.get(type_name)
+                if struct_body is None:
+                    raise SyntaxError("Unknown type \"{}\"".format(type_name))
+
+                if initializer.strip() == "zeroinitializer":
+                    # laid out as bytes, so that the padding between fields is included
+                    size, _ = _get_layout(type_name, self.struct_types)
+                    element_type = LLVMType("i8")
+                    data, addresses = np.zeros(size, dtype=np.int64), {}
+                else:
+                    element_type, (data, addresses) = _parse_struct_initializer(struct_body + " " + initializer)
+            elif body.startswith("["):
+                count, element_type, initializer = _split_array_type(body)
+                data, addresses = _parse_array_initializer(count, element_type, initializer.strip())
+            elif body.startswith("{") or body.startswith("<{"):
+                element_type, (data, addresses) = _parse_struct_initializer(body)
+            else:
+                split = ltrim_regex(body, TYPE_PATTERN)
+                if not split:
+                    raise SyntaxError("Unsupported type")
+                type_string, initializer = split
+                element_type = LLVMType(type_string)
+                data, addresses = _parse_scalar_initializer(type_string, initializer.strip())
+        except (SyntaxError, ValueError) as error:
+            raise SyntaxError("Unsupported initializer for global {}: {}".format(name, error)) from error
+
+        return LLVMGlobal(
+            name=name,
+            element_type=element_type,
+            data=data,
+            align=int(align_match[1]) if align_match else None,
+            addresses=addresses
+        )
+    
     def parse_function_decl(self) -> LLVMFunction:
         """
         Current line position should be set to the function header line
@@ -238,13 +717,34 @@ class _LLVMParser:
         header = self.get_current_line()
         # remove the leading "define" keyword, and remove any whitespace
         header = ltrim(header, "define").strip()
-        # parse out the type string (e.g. "i32*") and remove whitespace
-        return_type_string, header = unwrap(ltrim_regex(header, TYPE_PATTERN))
-        header = header.strip()
-        # parse out the name of the function, and remove any whitespace
-        function_name, header = unwrap(ltrim_regex(header, FUNCTION_PATTERN))
-
+        # parse out the return type (e.g. "i32*"), the name of the function and the parameter
+        # list, skipping any linkage keywords (e.g. "dso_local") before the return type
+        match = re.match(r'(.*?)(' + TYPE_PATTERN + r') (' + FUNCTION_PATTERN + r')\(', header)
+        if not match:
+            raise SyntaxError("Invalid function header \"{}\"".format(header))
+        
+        return_type_string, function_name = match[2], match[3]
         return_type = LLVMType(return_type_string)
+
+        # the parameter list ends at the matching parenthesis, since parameters may have
+        # parentheses of their own (e.g. "byval(%struct.point)" or "void (i32)*")
+        depth = 1
+        end = match.end()
+        while depth:
+            if end == len(header):
+                raise SyntaxError("Invalid function header \"{}\"".format(header))
+            depth += {"(": 1, ")": -1}.get(header[end], 0)
+            end += 1
+        parameters_string = header[match.end():end - 1]
+
+        # each parameter is written as "<type> [attributes...] <register>" (e.g. "i32 noundef %0"),
+        # where the type may contain spaces (e.g. "[8 x i32]*")
+        parameters: list[LLVMSymbol] = []
+        for parameter in _split_top_level(parameters_string):
+            if not parameter or parameter == "...":
+                continue
+            type_string, register = re.sub(ATTRIBUTE_PATTERN, '', parameter).rsplit(" ", 1)
+            parameters.append(LLVMSymbol(LLVMType(type_string), register))
         
         self.next_line()
 
@@ -255,6 +755,13 @@ class _LLVMParser:
             if line == "}":
                 break
 
+            # "switch" instructions list their cases on the following lines, up to a
+            # closing "]"
+            if line.rstrip().endswith("["):
+                while not line.rstrip().endswith("]"):
+                    self.next_line()
+                    line += " " + self.get_current_line().strip()
+
             statement = self.parse_statement(line)
 
             if statement:
@@ -265,11 +772,18 @@ class _LLVMParser:
         return LLVMFunction(
             statements=statements,
             return_type=return_type,
-            name=function_name
+            name=function_name,
+            parameters=parameters
         )
     
     def parse_statement(self, line: str) -> Optional[LLVMStatement]:
-        line = line.strip()
+        # older versions of LLVM write block labels as comments (e.g. "; <label>:5:")
+        label_comment = re.match(r'; <label>:(\w+)', line.strip())
+        if label_comment:
+            return LLVMStatement.from_label(label_comment[1])
+        
+        # remove comments (e.g. "; preds = %4")
+        line = line.split(";")[0].strip()
 
         if line == "":
             return None
@@ -289,7 +803,8 @@ class _LLVMParser:
     def parse_instruction(self, line: str) -> LLVMInstruction:
         instruction_name, line = unwrap(ltrim_regex(line, r'\w+'))
         line = line.strip()
-        args = line.split(",")
+        # only operands with aggregate types or constant expressions contain nested commas
+        args = _split_top_level(line) if "(" in line or "{" in line else line.split(",")
 
         # remove leading and trailing whitespace from unparsed argument strings
         args = [arg.strip() for arg in args]
@@ -310,41 +825,110 @@ class _LLVMParser:
                 associated_type=LLVMType(args[0]),
                 args=[LLVMSymbol.from_argument(args[1])]
             )
-        if instruction_name == "add" or instruction_name == "sub":
-            mode = None
-
-            if args[0] == "nsw" or args[0] == "nuw":
-                args.pop()
-       
-            if args[0] == "nsw" or args[0] == "nuw":
-                args.pop()
+        if instruction_name in BINARY_OPERATORS:
+            # e.g. "add nsw i32 %5, 1"; remove the "nsw", "nuw" and "exact" flags
+            line = re.sub(r'^((nsw|nuw|exact) )+', '', line)
+            left, right = [arg.strip() for arg in line.split(",")]
+            type_string, _ = left.rsplit(" ", 1)
 
+            return LLVMInstruction(
+                name=instruction_name,
+                associated_type=LLVMType(type_string),
+                args=[LLVMSymbol.from_argument(left), LLVMSymbol.from_argument(type_string + " " + right)]
+            )
+        if instruction_name == "icmp":
+            # e.g. "icmp slt i32 %5, 10"
+            mode, line = line.split(" ", 1)
+            left, right = [arg.strip() for arg in line.split(",")]
+            type_string, _ = left.rsplit(" ", 1)
 
             return LLVMInstruction(
                 name=instruction_name,
                 mode=mode,
-                args=[LLVMSymbol.from_argument(args[0]), LLVMSymbol.from_argument(args[0])]
+                associated_type=LLVMType(type_string),
+                args=[LLVMSymbol.from_argument(left), LLVMSymbol.from_argument(type_string + " " + right)]
+            )
+        if instruction_name in CAST_OPERATORS:
+            # e.g. "sext i8 %5 to i32"
+            value_string, type_string = line.rsplit(" to ", 1)
+
+            return LLVMInstruction(
+                name=instruction_name,
+                associated_type=LLVMType(type_string),
+                args=[LLVMSymbol.from_argument(value_string)]
             )
         if instruction_name == "ret":
             return LLVMInstruction(
                 name=instruction_name,
-                args=[LLVMSymbol.from_argument(args[0])]
+                args=[] if args[0] == "void" else [LLVMSymbol.from_argument(args[0])]
+            )
+        if instruction_name == "br":
+            # either "br label %5" or "br i1 %4, label %5, label %6"
+            return LLVMInstruction(
+                name=instruction_name,
+                args=[LLVMSymbol.from_argument(arg) for arg in args]
+            )
+        if instruction_name == "switch":
+            # e.g. "switch i32 %5, label %9 [ i32 0, label %6 i32 1, label %7 ]"
+            # cases are stored as alternating values and labels after the value being
+            # switched on and the default label
+            match = re.match(r'(.+?), (label %\w+) \[(.*)\]', line)
+            if not match:
+                raise SyntaxError("Invalid switch instruction \"{}\"".format(line))
+            
+            cases = re.findall(r'(\w+ -?\w+), (label %\w+)', match[3])
+
+            return LLVMInstruction(
+                name=instruction_name,
+                args=[LLVMSymbol.from_argument(match[1]), LLVMSymbol.from_argument(match[2])] + [
+                    LLVMSymbol.from_argument(arg) for case in cases for arg in case
+                ]
+            )
+        if instruction_name == "call":
+            # e.g. "call i32 @add(i32 noundef %5, i32 noundef 1)"
+            match = re.match(r'(.*?)(' + GLOBAL_PATTERN + r')\((.*)\)', line)
+            if not match:
+                raise SyntaxError("Unsupported call \"{}\"".format(line))
+            
+            # the return type is the first word that is a type rather than an attribute (e.g.
+            # "noundef"); varargs calls also list the function type (e.g. "i32 (i8*, ...)")
+            return_type_string = next(
+                word for word in match[1].split(" ")
+                if re.match(r'(void|ptr|i\d+)\**$', word)
+            )
+            arguments = [
+                re.sub(ATTRIBUTE_PATTERN, '', argument) for argument in _split_top_level(match[3]) if argument
+            ]
+
+            # the first argument is the function being called
+            return LLVMInstruction(
+                name=instruction_name,
+                associated_type=LLVMType(return_type_string),
+                args=[LLVMSymbol(LLVMType(return_type_string), match[2])] + [
+                    LLVMSymbol.from_argument(argument) for argument in arguments
+                ]
             )
         if instruction_name == "getelementptr":
             # if the "inbounds" specifier is present, remove it
-            if args[0] == "inbounds":
-                args.pop(0)
+            args[0] = ltrim(args[0], "inbounds").strip()
             
             type = LLVMType(args[0])
 
+            # the first argument is the base pointer, followed by one or more indices
             return LLVMInstruction(
                 name=instruction_name,
                 associated_type=type,
-                args=[LLVMSymbol.from_argument(args[1]), LLVMSymbol.from_argument(args[2])]
+                args=[LLVMSymbol.from_argument(arg) for arg in args[1:]]
             )
 
         raise SyntaxError("Unsupported LLVM IR instruction \"{}\"".format(instruction_name))
 
 
 def parse(source: str) -> list[LLVMFunction]:
-    return _LLVMParser(source).parse()
\ No newline at end of file
+    return _LLVMParser(source).parse()
+
+def parse_module(source: str) -> LLVMModule:
+    parser = _LLVMParser(source)
+    functions = parser.parse()
+
+    return LLVMModule(functions=functions, globals=parser.globals)
\ No newline at end of file
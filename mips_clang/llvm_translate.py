@@ -1,45 +1,444 @@
-from mips_clang.util import ltrim
-from .llvm_parse import LLVMFunction, LLVMSymbol, LLVMType, parse
-
-def get_sizeof(type: LLVMType) -> int:
-    """Return the size of the given type in bytes"""
-
-    if type.pointer:
-        # MARS uses MIPS32
-        return 4
-    if type.type_name == "i32":
-        return 4
-    if type.type_name == "i8":
-        return 1
-    
-    raise ValueError("Unrecognized type \"{}\"".format(type.type_name))
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+from mips_clang.util import ltrim, unwrap
+from .llvm_inline import INLINE_MAX_DEPTH, INLINE_MAX_SIZE, InlineDecision, inline_functions
+from .llvm_loops import LoopOptimizationStats, optimize_loops
+from .llvm_parse import LLVMFunction, LLVMGlobal, LLVMInstruction, LLVMSymbol, LLVMType, get_sizeof, parse_module
+import copy
+import multiprocessing
+import numpy as np
+import re
+
+DATA_DIRECTIVES = {1: ".byte", 2: ".half", 4: ".word"}
+
+MIN_RUN_LENGTH = 4
+"""Runs of at least this many repeated elements are collapsed into `.space` or `value:count`"""
+
+VALUES_PER_LINE = 16
+
+LINEAR_SWITCH_MAX_CASES = 3
+"""Switches (and binary search subtrees) with at most this many cases are lowered to a compare-and-branch chain"""
+
+JUMP_TABLE_MIN_DENSITY = 0.4
+"""Minimum fraction of the case value range that must be covered by cases to use a jump table"""
+
+PARALLEL_MIN_FUNCTIONS = 64
+"""Modules with fewer functions are always translated in a single process"""
+
+CHUNKS_PER_JOB = 4
+"""Number of chunks of functions handed to each worker process, to even out their load"""
+
+ARGUMENT_REGISTER_COUNT = 4
+"""Number of arguments passed in $a0-$a3; the others are passed on the stack (see `docs/calling_convention.txt`)"""
+
+MEMORY_ACCESS_SUFFIXES = {1: "b", 2: "h", 4: "w"}
+"""Suffixes of the MIPS load/store instructions (e.g. `lb`, `sw`) for each access size"""
+
+BINARY_OPERATOR_INSTRUCTIONS = {
+    "add": "addu",
+    "sub": "subu",
+    "mul": "mul",
+    "sdiv": "div",
+    "udiv": "divu",
+    "srem": "rem",
+    "urem": "remu",
+    "and": "and",
+    "or": "or",
+    "xor": "xor",
+    "shl": "sllv",
+    "ashr": "srav",
+    "lshr": "srlv"
+}
+
+ICMP_INSTRUCTIONS = {
+    "eq": "seq",
+    "ne": "sne",
+    "slt": "slt",
+    "sgt": "sgt",
+    "sle": "sle",
+    "sge": "sge",
+    "ult": "sltu",
+    "ugt": "sgtu",
+    "ule": "sleu",
+    "uge": "sgeu"
+}
 
 def function_name_as_mips_label(function_name: str) -> str:
     assert function_name.startswith("@")
     return "__func_"+ltrim(function_name, "@")
 
+def block_label_as_mips_label(function_name: str, label: str) -> str:
+    # LLVM block labels (e.g. "5") are only unique within a function
+    return "__block_{}_{}".format(ltrim(function_name, "@"), label)
+
+def symbol_as_text(symbol: LLVMSymbol) -> str:
+    """Return [symbol] as it is shown in the comments of the generated code"""
+
+    if symbol.is_constant():
+        return str(symbol.get_constant_value())
+    if symbol.is_global():
+        return "@" + symbol.get_global_name() + (
+            "+{}".format(symbol.get_global_offset()) if symbol.get_global_offset() else ""
+        )
+    
+    return "%" + symbol.get_register_name()
+
+def global_name_as_mips_label(global_name: str) -> str:
+    assert global_name.startswith("@")
+    # LLVM allows characters such as "." in global names (e.g. "@.str")
+    return "__global_"+re.sub(r'[^\w]', "_", ltrim(global_name, "@"))
+
+def global_location(symbol: LLVMSymbol) -> str:
+    """
+    Return the address of the global [symbol] points to as a MIPS operand, such as
+    `"__global_table"` or `"__global_table+8"` for constant `getelementptr` expressions
+    """
+
+    label = global_name_as_mips_label("@" + symbol.get_global_name())
+    if symbol.get_global_offset():
+        return "{}+{}".format(label, symbol.get_global_offset())
+    return label
+
+def _data_directives(data: np.ndarray, element_size: int) -> list[str]:
+    """
+    Return the MARS data directives that lay out [data], one element of [element_size]
+    bytes each. Runs of zeros are emitted as `.space`, other long runs of repeated values
+    use the `value:count` syntax, and everything else is packed into comma-separated lines.
+    """
+
+    directive = DATA_DIRECTIVES[element_size]
+    output: list[str] = []
+
+    def add_literals(start: int, end: int) -> None:
+        for line_start in range(start, end, VALUES_PER_LINE):
+            values = data[line_start:min(line_start + VALUES_PER_LINE, end)].tolist()
+            output.append(directive + " " + ", ".join(map(str, values)))
+
+    if len(data) == 0:
+        return output
+    
+    # find the start and length of every run of equal values
+    run_starts = np.concatenate(([0], np.flatnonzero(data[1:] != data[:-1]) + 1))
+    run_lengths = np.diff(np.append(run_starts, len(data)))
+
+    position = 0
+
+    for run in np.flatnonzero(run_lengths >= MIN_RUN_LENGTH).tolist():
+        start = int(run_starts[run])
+        length = int(run_lengths[run])
+        value = int(data[start])
+
+        add_literals(position, start)
+
+        if value == 0:
+            output.append(".space {}".format(length * element_size))
+        else:
+            output.append("{} {}:{}".format(directive, value, length))
+        
+        position = start + length
+    
+    add_literals(position, len(data))
+
+    return output
+
 class _LLVMTranslator:
     source: str
     functions: list[LLVMFunction]
+    function_names: set[str]
+    globals: list[LLVMGlobal]
+
+    inline_max_size: int
+    inline_max_depth: int
+    inline_decisions: list[InlineDecision]
+    """The inlining decision made for every call site, in the order they were made"""
+    _inline_decisions_by_caller: dict[str, list[InlineDecision]]
+
+    loop_optimizations: bool
+    loop_stats: dict[str, LoopOptimizationStats]
+    """Maps function names to what the loop optimizations did to them"""
+
+    jobs: int
+    """Number of processes functions are translated in"""
 
-    def __init__(self, ll_source: str) -> None:
+    def __init__(
+        self,
+        ll_source: str,
+        loop_optimizations: bool = True,
+        inline_max_size: int = INLINE_MAX_SIZE,
+        inline_max_depth: int = INLINE_MAX_DEPTH,
+        jobs: int = 1
+    ) -> None:
         self.source = ll_source
-        self.functions = parse(ll_source)
+        module = parse_module(ll_source)
+        self.functions = module.functions
+        self.function_names = {function.name for function in self.functions}
+        self.globals = module.globals
+        self.inline_max_size = inline_max_size
+        self.inline_max_depth = inline_max_depth
+        self.inline_decisions = []
+        self._inline_decisions_by_caller = {}
+        self.loop_optimizations = loop_optimizations
+        self.loop_stats = {}
+        self.jobs = jobs
+
+    def run_passes(self) -> None:
+        """
+        Run the IR optimization passes that need to see the whole module, modifying the
+        functions in place. The other passes run in `run_function_passes`.
+        """
+
+        # inlining runs first, so that the other passes see constant arguments in the
+        # inlined bodies and loops that contained calls
+        if self.inline_max_size > 0 and self.inline_max_depth > 0:
+            self.inline_decisions = inline_functions(self.functions, self.inline_max_size, self.inline_max_depth)
+
+        self._inline_decisions_by_caller = {}
+        for decision in self.inline_decisions:
+            self._inline_decisions_by_caller.setdefault(decision.caller, []).append(decision)
+
+    def run_function_passes(self, function: LLVMFunction) -> None:
+        """Run the IR optimization passes that only look at [function], modifying it in place"""
+
+        if self.loop_optimizations:
+            self.loop_stats[function.name] = optimize_loops(function)
+
+    def translate_functions(self) -> list[str]:
+        """
+        Run the per-function passes over every function and translate it, in [jobs]
+        processes if the module is large enough. The output is the same, and in the same
+        order, either way, since each function is translated independently. (In worker
+        processes, the passes modify copies of the functions rather than [functions].)
+        """
+
+        if self.jobs <= 1 or len(self.functions) < PARALLEL_MIN_FUNCTIONS:
+            output: list[str] = []
+
+            for function in self.functions:
+                self.run_function_passes(function)
+                output.append(self.translate_function(function))
+
+            return output
+
+        global _worker_translator
+        chunk_size = -(-len(self.functions) // (self.jobs * CHUNKS_PER_JOB))
+        pool_options: dict[str, Any]
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            # forked workers inherit this translator, with the parsed functions, so only
+            # the index of each function is sent to them
+            _worker_translator = self
+            pool_options = {"mp_context": multiprocessing.get_context("fork")}
+        else:
+            # otherwise, each worker is sent the translator once; it does not need the
+            # source or the globals
+            worker_translator = copy.copy(self)
+            worker_translator.source = ""
+            worker_translator.globals = []
+            pool_options = {"initializer": _init_worker, "initargs": (worker_translator,)}
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.jobs, **pool_options) as executor:
+                results = list(executor.map(_translate_in_worker, range(len(self.functions)), chunksize=chunk_size))
+        finally:
+            _worker_translator = None
+
+        for function, (_, stats) in zip(self.functions, results):
+            if stats is not None:
+                self.loop_stats[function.name] = stats
+
+        return [text for text, _ in results]
 
     def translate(self) -> str:
         output = ""
+        self.run_passes()
 
-        for function in self.functions:
-            output += self.translate_function(function) + "\n"
+        if self.globals:
+            output += ".data\n"
+
+            for global_decl in self.globals:
+                output += self.translate_global(global_decl) + "\n"
+            
+            output += ".text\n"
+
+        # joined at once, since the output of large modules is several megabytes long
+        output += "".join(function_output + "\n" for function_output in self.translate_functions())
         
         return output
     
+    def get_call_label(self, function_name: str) -> str:
+        """
+        Return the label to jump to when calling [function_name]. Functions that are not
+        defined in this module are expected to be hand-written MIPS routines, which are
+        called by their plain name.
+        """
+
+        name = "@" + function_name
+        if name in self.function_names:
+            return function_name_as_mips_label(name)
+        
+        return function_name
+
     def get_function(self, name: str) -> LLVMFunction:
         for f in self.functions:
             if f.name == name:
                 return f
         raise ValueError("No function with name \"{}\"".format(name))
     
+    def translate_global(self, global_decl: LLVMGlobal) -> str:
+        element_size = get_sizeof(global_decl.element_type)
+        align = global_decl.align or element_size
+
+        output = [".align {}".format(align.bit_length() - 1)] if align > 1 else []
+        output.append(global_name_as_mips_label(global_decl.name) + ":")
+
+        # elements holding the address of a global are emitted as ".word <label>", between
+        # the directives for the other elements
+        lines: list[str] = []
+        position = 0
+
+        for index, symbol in sorted(global_decl.addresses.items()):
+            lines.extend(_data_directives(global_decl.data[position:index], element_size))
+            lines.append(".word " + global_location(symbol))
+            position = index + 1
+        lines.extend(_data_directives(global_decl.data[position:], element_size))
+
+        output.extend("    " + line for line in lines)
+
+        return "\n".join(output)
+
+    def translate_switch(self, function: LLVMFunction, switch_index: int, instruction: LLVMInstruction) -> list[str]:
+        """
+        Lower a `switch` instruction to a jump table, a binary search tree of branches, or a
+        linear compare-and-branch chain, depending on the number and density of its cases.
+        The value being switched on should already be loaded into $t1.
+        """
+
+        output: list[str] = []
+        default_label = block_label_as_mips_label(function.name, instruction.args[1].get_register_name())
+        cases = sorted(
+            (value_symbol.get_constant_value(), block_label_as_mips_label(function.name, label.get_register_name()))
+            for value_symbol, label in zip(instruction.args[2::2], instruction.args[3::2])
+        )
+        # prefix for labels internal to this switch
+        switch_label = "__switch_{}_{}".format(ltrim(function.name, "@"), switch_index)
+
+        if not cases:
+            output.append("# switch lowered as an unconditional jump (no cases)")
+            output.append("j {}".format(default_label))
+            return output
+
+        low = cases[0][0]
+        high = cases[-1][0]
+        case_range = high - low + 1
+        density = len(cases) / case_range
+
+        def add_linear_chain(chain: list[tuple[int, str]]) -> None:
+            for case_value, label in chain:
+                output.append("li $t2,{}".format(case_value))
+                output.append("beq $t1,$t2,{}".format(label))
+            output.append("j {}".format(default_label))
+        
+        if len(cases) <= LINEAR_SWITCH_MAX_CASES:
+            output.append("# switch lowered as a linear chain ({} cases)".format(len(cases)))
+            add_linear_chain(cases)
+        elif density >= JUMP_TABLE_MIN_DENSITY:
+            output.append("# switch lowered as a jump table ({} cases, range {}, density {:.2f})".format(
+                len(cases), case_range, density
+            ))
+            table_label = switch_label + "_table"
+            targets = dict(cases)
+
+            # $t1 = value - low; values below [low] wrap around to large unsigned numbers,
+            # so a single unsigned comparison checks both bounds
+            if low != 0:
+                output.append("addiu $t1,$t1,{}".format(-low))
+            output.append("sltiu $t2,$t1,{}".format(case_range))
+            output.append("beqz $t2,{}".format(default_label))
+            output.append("sll $t1,$t1,2")
+            output.append("lw $t1,{}($t1)".format(table_label))
+            output.append("jr $t1")
+
+            output.append(".data")
+            output.append(".align 2")
+            output.append(table_label + ":")
+            for line_start in range(low, high + 1, VALUES_PER_LINE):
+                output.append("    .word " + ", ".join(
+                    targets.get(case_value, default_label)
+                    for case_value in range(line_start, min(line_start + VALUES_PER_LINE, high + 1))
+                ))
+            output.append(".text")
+        else:
+            output.append("# switch lowered as a binary search tree ({} cases, range {}, density {:.2f})".format(
+                len(cases), case_range, density
+            ))
+            node_count = 0
+
+            def add_search_tree(subtree: list[tuple[int, str]]) -> None:
+                nonlocal node_count
+
+                if len(subtree) <= LINEAR_SWITCH_MAX_CASES:
+                    add_linear_chain(subtree)
+                    return
+                
+                middle = len(subtree) // 2
+                upper_label = "{}_node{}".format(switch_label, node_count)
+                node_count += 1
+
+                # values below the pivot are searched in the lower half, everything else
+                # in the upper half
+                output.append("li $t2,{}".format(subtree[middle][0]))
+                output.append("bge $t1,$t2,{}".format(upper_label))
+                add_search_tree(subtree[:middle])
+                output.append(upper_label + ":")
+                add_search_tree(subtree[middle:])
+
+            add_search_tree(cases)
+
+        return output
+
+    def translate_memory_intrinsic(self, function: LLVMFunction, intrinsic_index: int, intrinsic: str) -> list[str]:
+        """
+        Lower a call to the `llvm.memcpy`, `llvm.memmove` or `llvm.memset` intrinsic (which
+        clang emits e.g. to initialize local arrays) to a byte loop, since there is no MIPS
+        routine to jump to. The destination address should already be loaded into $t1, the
+        source address (or the byte value, for `llvm.memset`) into $t2, and the number of
+        bytes into $t3.
+        """
+
+        output: list[str] = []
+        # prefix for labels internal to this loop
+        loop_label = "__{}_{}_{}".format(intrinsic, ltrim(function.name, "@"), intrinsic_index)
+
+        if intrinsic == "memmove":
+            # overlapping memory is copied backwards when the destination is above the
+            # source, so that bytes are read before they are overwritten
+            output.append("sltu $t4,$t2,$t1")
+            output.append("beqz $t4,{}_forward".format(loop_label))
+            output.append("addu $t1,$t1,$t3")
+            output.append("addu $t2,$t2,$t3")
+            output.append("addiu $t1,$t1,-1")
+            output.append("addiu $t2,$t2,-1")
+            output.append("li $t5,-1")
+            output.append("j {}_next".format(loop_label))
+            output.append(loop_label + "_forward:")
+
+        # $t5 is the step between bytes
+        output.append("li $t5,1")
+        output.append(loop_label + "_next:")
+        output.append("beqz $t3,{}_end".format(loop_label))
+        if intrinsic == "memset":
+            output.append("sb $t2,($t1)")
+        else:
+            output.append("lbu $t4,($t2)")
+            output.append("sb $t4,($t1)")
+            output.append("addu $t2,$t2,$t5")
+        output.append("addu $t1,$t1,$t5")
+        output.append("addiu $t3,$t3,-1")
+        output.append("j {}_next".format(loop_label))
+        output.append(loop_label + "_end:")
+
+        return output
+
     def translate_function(self, function: LLVMFunction) -> str:
         """
         See `docs/calling_convention.txt` for more information
@@ -51,12 +450,39 @@ class _LLVMTranslator:
         if function.name == "@main":
             output.append(".text")
 
-        # 4 bytes are needed on the stack to store the return address
-        stackframe_size = 4
+        for decision in self._inline_decisions_by_caller.get(function.name, []):
+            output.append("# {}".format(decision))
+
+        if function.name in self.loop_stats and self.loop_stats[function.name].loops:
+            stats = self.loop_stats[function.name]
+            output.append("# loop optimizations: {} loops, {} instructions hoisted, {} strength-reduced".format(
+                stats.loops, stats.hoisted, stats.strength_reduced
+            ))
+
+        # intrinsics are lowered inline rather than called
+        calls = [
+            statement.get_instruction() for statement in function.statements
+            if not statement.is_label() and statement.get_instruction().name == "call"
+            and not statement.get_instruction().args[0].get_global_name().startswith("llvm.")
+        ]
+
+        # functions that make calls reserve an outgoing argument area at the bottom of
+        # their frame, with room for at least the 4 words callees may spill $a0-$a3 to,
+        # and save the return address just above it. leaf functions need neither.
+        if calls:
+            stackframe_size = max(ARGUMENT_REGISTER_COUNT, *(len(call.args) - 1 for call in calls)) * 4
+            return_address_sp_offset: Optional[int] = stackframe_size
+            stackframe_size += 4
+        else:
+            stackframe_size = 0
+            return_address_sp_offset = None
 
         registers: dict[str, LLVMSymbol] = {}
         # maps register names to corresponding stack pointer offsets
         register_sp_offsets: dict[str, int] = {}
+        # maps registers assigned by "alloca" to the stack pointer offsets of the memory
+        # they point to
+        alloca_sp_offsets: dict[str, int] = {}
 
         # begin by identifiying all registers used
         for statement in function.statements:
@@ -66,27 +492,74 @@ class _LLVMTranslator:
                 register_sp_offsets[assign_to.get_register_name()] = stackframe_size
                 stackframe_size += 4
 
+        # then reserve the memory allocated by "alloca" instructions, rounded up to a
+        # multiple of 4 bytes to keep the stack word-aligned
+        for statement in function.statements:
+            if statement.is_assignment() and statement.get_instruction().name == "alloca":
+                alloca_sp_offsets[statement.get_assignment_target().get_register_name()] = stackframe_size
+                stackframe_size += (get_sizeof(unwrap(statement.get_instruction().associated_type)) + 3) // 4 * 4
+
+        # the O32 convention keeps the stack pointer 8-byte aligned
+        stackframe_size = (stackframe_size + 7) // 8 * 8
+
+        # the parameters live in the caller's outgoing argument area, just above this
+        # stack frame: the caller stored the arguments after the 4th there, and the
+        # arguments passed in $a0-$a3 are spilled to the words reserved for them
+        for i, parameter in enumerate(function.parameters):
+            registers[parameter.get_register_name()] = parameter
+            register_sp_offsets[parameter.get_register_name()] = stackframe_size + 4 * i
+
         # add instruction to allocate space on the stack
-        output.append("addiu $sp,$sp,-{}".format(stackframe_size))
+        if stackframe_size:
+            output.append("addiu $sp,$sp,-{}".format(stackframe_size))
         
-        # add instruction to save the return address
-        output.append("sw $ra,($sp)")
+        # add instruction to save the return address, which calls overwrite
+        if return_address_sp_offset is not None:
+            output.append("sw $ra,{}($sp)".format(return_address_sp_offset))
+
+        for i, parameter in enumerate(function.parameters[:ARGUMENT_REGISTER_COUNT]):
+            output.append("sw $a{},{}($sp)".format(i, register_sp_offsets[parameter.get_register_name()]))
+
+        def load_operand(symbol: LLVMSymbol, mips_register: str) -> None:
+            """Add instructions to load the value of [symbol] into [mips_register]"""
+
+            if symbol.is_constant():
+                output.append("li {},{}".format(mips_register, symbol.get_constant_value()))
+            elif symbol.is_global():
+                output.append("la {},{}".format(mips_register, global_location(symbol)))
+            else:
+                output.append("lw {},{}($sp)".format(mips_register, register_sp_offsets[symbol.get_register_name()]))
+        
+        def pointer_location(pointer: LLVMSymbol) -> str:
+            """
+            Return the MIPS memory operand (e.g. `"8($sp)"` or `"($t2)"`) that refers to
+            the memory [pointer] points to, adding instructions to load the pointer into $t2
+            if necessary
+            """
+
+            if pointer.is_global():
+                return global_location(pointer)
+            if pointer.is_register() and pointer.get_register_name() in alloca_sp_offsets:
+                return "{}($sp)".format(alloca_sp_offsets[pointer.get_register_name()])
+            
+            load_operand(pointer, "$t2")
+            return "($t2)"
+
+        # number of "switch" instructions and memory intrinsics translated so far, used to
+        # name their labels
+        switch_count = 0
+        intrinsic_count = 0
 
         # translate instructions
         for statement in function.statements:
             if statement.is_label():
-                output.append(statement.get_label_name() + ":")
+                output.append(block_label_as_mips_label(function.name, statement.get_label_name()) + ":")
                 continue
 
             # assume statement contains an instruction
             instruction = statement.get_instruction()
             iname = instruction.name
-            # print(iname)
-            # print([str(arg) for arg in instruction.args])
-            instruction_text = iname + " " + " ".join(
-                str(arg.get_constant_value()) if arg.is_constant() else "%"+arg.get_register_name()
-                for arg in instruction.args
-            )
+            instruction_text = iname + " " + " ".join(symbol_as_text(arg) for arg in instruction.args)
             output.append("")
             if statement.is_assignment():
                 output.append("# %{} = {}".format(
@@ -106,66 +579,148 @@ class _LLVMTranslator:
                 # get the register we're assigning to
                 target_register = statement.get_assignment_target().get_register_name()
 
-                # we've already pre-allocated space on the stack for this register
-                # assign the value of this register to its own address
+                # we've already pre-allocated space on the stack for the allocated memory;
+                # assign its address to this register
                 output.append("move $t7,$sp")
-                output.append("addu $t7,$t7,{}".format(register_sp_offsets[target_register]))
+                output.append("addu $t7,$t7,{}".format(alloca_sp_offsets[target_register]))
 
                 instruction_has_output = True
             elif iname == "store":
                 stored_value = instruction.args[0]
                 dest = instruction.args[1]
-                assert dest.is_register()
 
                 # $t1 contains the value being stored
-                # $t2 contains the address being stored to (the pointer contained inside the target
-                # register)
-
-                if stored_value.is_constant():
-                    output.append("li $t1,{}".format(stored_value.get_constant_value()))
-                else:
-                    output.append("lw $t1,{}($sp)".format(
-                        register_sp_offsets[stored_value.get_register_name()])
-                    )
-
-                dest_type = dest.get_type()
-                assert 1 <= dest_type.pointer <= 2
-
-                if dest_type.pointer == 1:
-                    output.append("lw $t2,{}($sp)".format(
-                        register_sp_offsets[dest.get_register_name()])
-                    )
-                    output.append("sw $t1,($t2)")
-                else:
-                    output.append("sw $t1,{}($sp)".format(
-                        register_sp_offsets[dest.get_register_name()]
-                    ))
+                # $t2 contains the address being stored to, if it is not known statically
+                load_operand(stored_value, "$t1")
+                output.append("s{} $t1,{}".format(
+                    MEMORY_ACCESS_SUFFIXES[get_sizeof(stored_value.get_type())],
+                    pointer_location(dest)
+                ))
             elif iname == "load":
                 target = instruction.args[0]
-                output.append("lw $t7,{}($sp)".format(
-                    register_sp_offsets[target.get_register_name()]
+                output.append("l{} $t7,{}".format(
+                    MEMORY_ACCESS_SUFFIXES[get_sizeof(unwrap(instruction.associated_type))],
+                    pointer_location(target)
                 ))
 
                 instruction_has_output = True
             elif iname == "getelementptr":
-                base_addr_register = instruction.args[0]
-                offset = instruction.args[1]
+                base_addr = instruction.args[0]
+                load_operand(base_addr, "$t7")
 
-                output.append("lw $t7,{}($sp)".format(
-                    register_sp_offsets[base_addr_register.get_register_name()]
-                ))
-                if offset.is_constant():
-                    output.append("addiu $t7,$t7,{}".format(offset.get_constant_value()))
-                else:
-                    output.append("lw $t1,{}($sp)".format(
-                        register_sp_offsets[offset.get_register_name()]
-                    ))
+                # the first index steps over whole objects of the associated type; each
+                # following index steps into the elements of the (array) type before it
+                indexed_type = unwrap(instruction.associated_type)
+
+                for i, index in enumerate(instruction.args[1:]):
+                    if i > 0:
+                        indexed_type = unwrap(indexed_type.element_type)
+                    size = get_sizeof(indexed_type)
+
+                    if index.is_constant():
+                        if index.get_constant_value() != 0:
+                            output.append("addiu $t7,$t7,{}".format(index.get_constant_value() * size))
+                        continue
+                    
+                    load_operand(index, "$t1")
+                    if size & (size - 1) == 0:
+                        if size > 1:
+                            output.append("sll $t1,$t1,{}".format(size.bit_length() - 1))
+                    else:
+                        output.append("li $t2,{}".format(size))
+                        output.append("mul $t1,$t1,$t2")
                     output.append("addu $t7,$t7,$t1")
                 instruction_has_output = True
+            elif iname in BINARY_OPERATOR_INSTRUCTIONS:
+                load_operand(instruction.args[0], "$t1")
+                load_operand(instruction.args[1], "$t2")
+                output.append("{} $t7,$t1,$t2".format(BINARY_OPERATOR_INSTRUCTIONS[iname]))
+
+                instruction_has_output = True
+            elif iname == "icmp":
+                load_operand(instruction.args[0], "$t1")
+                load_operand(instruction.args[1], "$t2")
+                output.append("{} $t7,$t1,$t2".format(ICMP_INSTRUCTIONS[unwrap(instruction.mode)]))
 
+                instruction_has_output = True
+            elif iname in ("sext", "zext", "trunc", "bitcast", "ptrtoint", "inttoptr"):
+                value = instruction.args[0]
+                value_type = value.get_type()
+                load_operand(value, "$t7")
+
+                # values narrower than 32 bits are extended explicitly; every other cast
+                # leaves the bits of the value unchanged
+                if not value_type.pointer and value_type.type_name in ("i8", "i16"):
+                    bits = get_sizeof(value_type) * 8
+
+                    if iname == "sext":
+                        output.append("sll $t7,$t7,{}".format(32 - bits))
+                        output.append("sra $t7,$t7,{}".format(32 - bits))
+                    elif iname == "zext":
+                        output.append("andi $t7,$t7,{}".format((1 << bits) - 1))
+
+                instruction_has_output = True
+            elif iname == "br":
+                if len(instruction.args) == 1:
+                    output.append("j {}".format(
+                        block_label_as_mips_label(function.name, instruction.args[0].get_register_name())
+                    ))
+                else:
+                    condition, true_label, false_label = instruction.args
+
+                    load_operand(condition, "$t1")
+                    output.append("bnez $t1,{}".format(
+                        block_label_as_mips_label(function.name, true_label.get_register_name())
+                    ))
+                    output.append("j {}".format(
+                        block_label_as_mips_label(function.name, false_label.get_register_name())
+                    ))
+            elif iname == "switch":
+                load_operand(instruction.args[0], "$t1")
+                output.extend(self.translate_switch(function, switch_count, instruction))
+                switch_count += 1
+            elif iname == "call" and instruction.args[0].get_global_name().startswith("llvm."):
+                # e.g. "llvm.memcpy.p0i8.p0i8.i32"
+                intrinsic = instruction.args[0].get_global_name().split(".")[1]
+
+                if intrinsic in ("memcpy", "memmove", "memset"):
+                    # the last argument ("isvolatile") doesn't affect the translation
+                    load_operand(instruction.args[1], "$t1")
+                    load_operand(instruction.args[2], "$t2")
+                    load_operand(instruction.args[3], "$t3")
+                    output.extend(self.translate_memory_intrinsic(function, intrinsic_count, intrinsic))
+                    intrinsic_count += 1
+                elif intrinsic != "lifetime":
+                    raise NotImplementedError("Unsupported intrinsic \"{}\"".format(
+                        instruction.args[0].get_global_name()
+                    ))
+            elif iname == "call":
+                callee = instruction.args[0]
+
+                # the first 4 arguments are passed in $a0-$a3, the others in the outgoing
+                # argument area at the bottom of this stack frame. no value is kept in a
+                # caller-saved register across the call, since every register lives on
+                # the stack.
+                for i, arg in enumerate(instruction.args[1:]):
+                    if i < ARGUMENT_REGISTER_COUNT:
+                        load_operand(arg, "$a{}".format(i))
+                    else:
+                        load_operand(arg, "$t1")
+                        output.append("sw $t1,{}($sp)".format(4 * i))
+                output.append("jal {}".format(self.get_call_label(callee.get_global_name())))
+
+                if statement.is_assignment():
+                    output.append("move $t7,$v0")
+                    instruction_has_output = True
             elif iname == "ret":
+                if instruction.args:
+                    load_operand(instruction.args[0], "$v0")
+                # restore the return address, which calls overwrote
+                if return_address_sp_offset is not None:
+                    output.append("lw $ra,{}($sp)".format(return_address_sp_offset))
                 # free allocated stack space
-                output.append("addiu $sp,$sp,{}".format(stackframe_size))
+                if stackframe_size:
+                    output.append("addiu $sp,$sp,{}".format(stackframe_size))
                 # return
                 output.append("jr $ra")
             else:
@@ -182,5 +737,30 @@ class _LLVMTranslator:
         indented = "\n".join("    " + line for line in output)
         return function_name_as_mips_label(function.name) + ":\n" + indented
 
-def ll_as_mips(ll_source: str) -> str:
-    return _LLVMTranslator(ll_source).translate()
\ No newline at end of file
+_worker_translator: Optional[_LLVMTranslator] = None
+"""The translator of a worker process started by `_LLVMTranslator.translate_functions`"""
+
+def _init_worker(translator: _LLVMTranslator) -> None:
+    global _worker_translator
+    _worker_translator = translator
+
+def _translate_in_worker(function_index: int) -> tuple[str, Optional[LoopOptimizationStats]]:
+    translator = unwrap(_worker_translator)
+    function = translator.functions[function_index]
+    translator.run_function_passes(function)
+    return translator.translate_function(function), translator.loop_stats.pop(function.name, None)
+
+def ll_as_mips(
+    ll_source: str,
+    loop_optimizations: bool = True,
+    inline_max_size: int = INLINE_MAX_SIZE,
+    inline_max_depth: int = INLINE_MAX_DEPTH,
+    jobs: int = 1
+) -> str:
+    return _LLVMTranslator(
+        ll_source,
+        loop_optimizations=loop_optimizations,
+        inline_max_size=inline_max_size,
+        inline_max_depth=inline_max_depth,
+        jobs=jobs
+    ).translate()
\ No newline at end of file